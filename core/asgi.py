@@ -1,12 +1,13 @@
 import os
 
-from channels.auth import AuthMiddlewareStack
 from channels.routing import ProtocolTypeRouter, URLRouter
 from channels.security.websocket import AllowedHostsOriginValidator
 from django.core.asgi import get_asgi_application
 from django.urls.resolvers import URLPattern
 
+from messenger.middleware import TimedAuthMiddlewareStack
 from messenger.routing import websocket_notification_urlpatterns
+from messenger.warmup import LifespanApplication
 
 os.environ.setdefault('DJANGO_SETTINGS_MODULE', 'core.settings_asgi')
 
@@ -14,7 +15,10 @@ asgi_application = get_asgi_application()
 
 application = ProtocolTypeRouter({
     'http': asgi_application,
+    # Warm up all connections before the ASGI server accepts any traffic (@see messenger.warmup)
+    'lifespan': LifespanApplication(),
     'websocket': AllowedHostsOriginValidator(
-        AuthMiddlewareStack(URLRouter(websocket_notification_urlpatterns)),
+        # Records the authentication as "auth" phase of the connect (@see messenger.metrics)
+        TimedAuthMiddlewareStack(URLRouter(websocket_notification_urlpatterns)),
     ),
 })
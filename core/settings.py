@@ -17,6 +17,11 @@ ASGI_APPLICATION = 'core.asgi.application'
 #         'BACKEND': 'channels.layers.InMemoryChannelLayer'
 #     },
 # }
+# CACHES = {
+#     'default': {
+#         'BACKEND': 'django.core.cache.backends.locmem.LocMemCache',
+#     },
+# }
 
 # --------------------------- PRODUCTION ---------------------------
 CHANNEL_LAYERS = {
@@ -28,6 +33,96 @@ CHANNEL_LAYERS = {
     },
 }
 
+# NOTE: Shared by all worker processes, e.g. for the inbox versions (@see MESSENGER_INBOX). A local memory cache would
+#       let every worker process answer "304 Not Modified" with its own (outdated) versions.
+CACHES = {
+    'default': {
+        'BACKEND': 'django.core.cache.backends.redis.RedisCache',
+        'LOCATION': 'redis://localhost:6379',
+    },
+}
+
+# Connection pool of this application to the in-memory database (@see messenger.connections)
+# NOTE: Without an explicit 'URL' the first host of the default channel layer is used.
+#       Use 'fakeredis://' as URL to run against an in-process fake Redis.
+MESSENGER_REDIS = {
+    'MAX_CONNECTIONS': 50,
+    'HEALTH_CHECK_INTERVAL': 30,
+}
+
+# Registry of all alive websocket channels (@see messenger.presence)
+# NOTE: Channels whose lease was not refreshed within 'TTL' seconds (e.g. after a worker crash) are evicted.
+#       Lookups are cached for 'CACHE_TTL' seconds within every worker process.
+MESSENGER_PRESENCE = {
+    'BACKEND': 'messenger.presence.RedisPresenceRegistry',
+    'TTL': 60,
+    'HEARTBEAT_INTERVAL': 20,
+    'CACHE_TTL': 5,
+}
+
+# Admission control for websocket handshakes of every worker process (@see messenger.admission)
+MESSENGER_ADMISSION = {
+    'MAX_CONCURRENT_HANDSHAKES': 64,
+    'QUEUE_TIMEOUT': 5,
+    'RETRY_AFTER': 10,
+}
+
+# Outgoing messages of every websocket are collected for 'FLUSH_DELAY' seconds,
+# superseded notification updates are dropped (@see messenger.outbound)
+MESSENGER_OUTBOUND = {
+    'FLUSH_DELAY': 0.05,
+}
+
+# Notifying many users at once (@see messenger.signals.notify_users)
+MESSENGER_FANOUT = {
+    # Maximum number of concurrent "group_send" calls
+    'CONCURRENCY': 64,
+    # Maximum number of users per set-based counter update & bulk read
+    'CHUNK_SIZE': 2000,
+}
+
+# Write-through cache of the unread messages counters, read by connecting users (@see messenger.counters)
+# 'messenger.counters.InMemoryCounterCache' keeps the counters within the worker process only (single process setups)
+# 'CHUNK_SIZE' is the maximum number of counters written within one (optimistic) Redis transaction
+MESSENGER_COUNTERS = {
+    'BACKEND': 'messenger.counters.RedisCounterCache',
+    'CHUNK_SIZE': 500,
+}
+
+# Maximum number of messages per page of the message overview (@see messenger.inbox)
+# 'VERSION_CACHE' holds the inbox versions, that let clients revalidate the message overview (ETag & Last-Modified)
+# NOTE: With more than one worker process, use a cache shared by all of them (e.g. the Redis cache above, not local memory)
+MESSENGER_INBOX = {
+    'PAGE_SIZE': 50,
+    'VERSION_CACHE': 'default',
+}
+
+# Denormalized inbox of group messages (@see messenger.models.GroupMessageInbox)
+# 'ENABLED' maintains the inbox, 'READ' lets the read paths use it (run "manage.py backfill_group_inbox" in between)
+MESSENGER_GROUP_INBOX = {
+    'ENABLED': False,
+    'READ': False,
+}
+
+# Cache of rendered message rows & bodies (@see messenger.fragments), shared by all worker processes via the Django
+# cache 'CACHE'. Fragments are cached for 'TIMEOUT' seconds at most.
+# 'messenger.fragments.LRUFragmentCache' keeps 'MAX_ENTRIES' fragments within the worker process (single process setups
+# only, other processes would serve outdated fragments of changed messages until they expire)
+# NOTE: Increment 'VERSION' after changing a fragment template, so no outdated fragments are served
+MESSENGER_FRAGMENTS = {
+    'BACKEND': 'messenger.fragments.SharedFragmentCache',
+    'CACHE': 'default',
+    'MAX_ENTRIES': 10000,
+    'TIMEOUT': 300,
+    'VERSION': 1,
+}
+
+# Serve the message views by their asynchronous variants (@see messenger.views.AsyncTemplateView)
+# Compare both variants under concurrent load with "manage.py benchmark_views"
+MESSENGER_VIEWS = {
+    'ASYNCHRONOUS': False,
+}
+
 SECRET_KEY = 'django-insecure-r^oei(gf#=%c8&4h*thasetoaoxte(*3h7%bm7s2!1i2k^l)m3'
 AUTH_USER_MODEL = 'messenger.ChannelUser'
 
@@ -84,6 +179,14 @@ DATABASES = {
     'default': {
         'ENGINE': 'django.db.backends.sqlite3',
         'NAME': BASE_DIR / 'db.sqlite3',
+        'OPTIONS': {
+            # Seconds a connection waits for the write lock of another one, instead of failing with "database is locked"
+            'timeout': 20,
+        },
+        'TEST': {
+            # NOTE: File based, an in-memory test DB is not shared between threads (e.g. of the concurrency tests)
+            'NAME': BASE_DIR / 'test_db.sqlite3',
+        },
     }
 }
 
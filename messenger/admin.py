@@ -1,10 +1,13 @@
 from typing import Optional
 
-from django.contrib.admin import ModelAdmin, register, display
+from django.contrib.admin import ModelAdmin, register, display, action
+from django.db.models import QuerySet
 from django.http import HttpRequest
 from django.utils.translation import gettext_lazy as _
 
+from messenger.dto import NotificationDTO
 from messenger.models import Notification, UserTextMessage, GroupTextMessage, ChannelUser
+from messenger.signals import notify_users
 
 
 @register(ChannelUser)
@@ -15,6 +18,7 @@ class ChannelUserAdmin(ModelAdmin):
 @register(Notification)
 class NotificationAdmin(ModelAdmin):
     readonly_fields = ('user', )
+    actions = ('push_notifications', )
 
     # Deactivate adding new notifications, it's a one-to-one relationship, and it is created automatically!
     def has_add_permission(self, request: HttpRequest, obj=None) -> bool:
@@ -24,6 +28,12 @@ class NotificationAdmin(ModelAdmin):
     def has_delete_permission(self, request: HttpRequest, obj: Optional[Notification] = None) -> bool:
         return False
 
+    @action(description=_('Push current counter to users'))
+    def push_notifications(self, request: HttpRequest, queryset: QuerySet[Notification]) -> None:
+        notifications = queryset.values_list('user_id', 'unread_messages')
+        notify_users((user_id, NotificationDTO(unread_messages)) for user_id, unread_messages in notifications)
+        self.message_user(request, _('Pushed notification counter to %(count)d user(s).') % {'count': len(notifications)})
+
 
 @register(UserTextMessage)
 class UserTextMessageAdmin(ModelAdmin):
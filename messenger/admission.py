@@ -0,0 +1,102 @@
+"""
+Admission control for websocket handshakes.
+
+After a deploy, every open browser tab reconnects at the same time. Each handshake authenticates the user, adds the
+channel to its group and creates a presence lease. The admission controller limits the number of concurrent handshakes
+per worker process and queues the rest for a limited time. Clients that can not be admitted in time are closed with
+the close code ``1013`` (Try Again Later) and a retry hint, so they spread their reconnects instead of piling up.
+
+Configuration example::
+
+    MESSENGER_ADMISSION = {
+        'MAX_CONCURRENT_HANDSHAKES': 64,    # Handshakes processed at the same time per worker process
+        'QUEUE_TIMEOUT': 5,                 # Seconds a handshake waits for admission before it is rejected
+        'RETRY_AFTER': 10,                  # Seconds rejected clients should wait at least before reconnecting
+    }
+"""
+__all__ = ('AdmissionRejected', 'AdmissionController', 'get_admission_controller', 'RETRY_CLOSE_CODE')
+
+import asyncio
+from typing import Any, Optional
+
+from django.conf import settings
+
+from messenger.metrics import REGISTRY, Counter
+
+# @see https://www.iana.org/assignments/websocket/websocket.xhtml#close-code-number
+RETRY_CLOSE_CODE: int = 1013
+
+HANDSHAKES = REGISTRY.register(Counter(
+    'messenger_admission_handshakes_total',
+    'Websocket handshakes by admission outcome (admitted/queued/rejected)',
+    ('outcome', ),
+))
+
+
+def _get_configuration() -> dict[str, Any]:
+    return {
+        'MAX_CONCURRENT_HANDSHAKES': 64,
+        'QUEUE_TIMEOUT': 5,
+        'RETRY_AFTER': 10,
+    } | getattr(settings, 'MESSENGER_ADMISSION', {})
+
+
+class AdmissionRejected(Exception):
+
+    def __init__(self, retry_after: float) -> None:
+        """
+        :param retry_after: Seconds the client should wait at least before it retries
+        """
+        super().__init__(f'Handshake not admitted, retry after {retry_after}s')
+        self.retry_after = retry_after
+
+
+class AdmissionController:
+
+    def __init__(self, max_concurrent: int, queue_timeout: float, retry_after: float) -> None:
+        """
+        :param max_concurrent: Maximum number of handshakes processed at the same time
+        :param queue_timeout: Seconds a handshake waits for admission before it is rejected
+        :param retry_after: Seconds rejected clients should wait at least before reconnecting
+        """
+        self.max_concurrent = max_concurrent
+        self.queue_timeout = queue_timeout
+        self.retry_after = retry_after
+        self._semaphore = asyncio.Semaphore(max_concurrent)
+
+    async def acquire(self) -> None:
+        """
+        Waits (at most the queue timeout) until the handshake is admitted.
+        Every successful acquisition must be followed by a ``release()``.
+
+        :raise AdmissionRejected: If the handshake could not be admitted in time
+        """
+        if self._semaphore.locked():
+            HANDSHAKES.inc(outcome='queued')
+            try:
+                await asyncio.wait_for(self._semaphore.acquire(), self.queue_timeout)
+            except TimeoutError:
+                HANDSHAKES.inc(outcome='rejected')
+                raise AdmissionRejected(self.retry_after) from None
+        else:
+            await self._semaphore.acquire()
+        HANDSHAKES.inc(outcome='admitted')
+
+    def release(self) -> None:
+        self._semaphore.release()
+
+
+_CONTROLLER: Optional[AdmissionController] = None
+
+
+def get_admission_controller() -> AdmissionController:
+    """
+    :return: Admission controller of this worker process, configured via the ``MESSENGER_ADMISSION`` setting
+    """
+    global _CONTROLLER
+    if _CONTROLLER is None:
+        configuration = _get_configuration()
+        _CONTROLLER = AdmissionController(
+            configuration['MAX_CONCURRENT_HANDSHAKES'], configuration['QUEUE_TIMEOUT'], configuration['RETRY_AFTER']
+        )
+    return _CONTROLLER
@@ -0,0 +1,189 @@
+"""
+Wire formats for DTOs (@see :mod:`messenger.dto`) sent via websocket.
+
+Clients choose their wire format via websocket subprotocol negotiation. JSON (text frames) is the default,
+binary formats are sent as bytes frames.
+
+Example::
+
+    // Prefer MessagePack, fall back to JSON
+    const webSocket = new WebSocket(url, ['messenger.msgpack', 'messenger.json']);
+    webSocket.binaryType = 'arraybuffer';
+
+Optional dependencies:
+    - `orjson <https://github.com/ijl/orjson>`__ speeds up JSON, otherwise the standard library is used
+    - `cbor2 <https://github.com/agronholm/cbor2>`__ enables the CBOR wire format
+
+@see `MDN - WebSocket protocols <https://developer.mozilla.org/en-US/docs/Web/API/WebSocket/WebSocket#protocols>`__
+"""
+__all__ = (
+    'DecodeError', 'AbstractCodec', 'JsonCodec', 'MessagePackCodec', 'CborCodec', 'CODECS', 'DEFAULT_CODEC', 'negotiate_codec',
+    'encode_constant',
+)
+
+import json
+from abc import ABC, abstractmethod
+from functools import lru_cache
+from typing import Any, ClassVar, Optional
+
+import msgpack  # NOTE: Always available, it is a dependency of "channels_redis"
+
+try:
+    import orjson
+except ImportError:
+    orjson = None
+
+try:
+    import cbor2
+except ImportError:
+    cbor2 = None
+
+from messenger.dto import AbstractMessageDTO
+
+
+class DecodeError(ValueError):
+    """
+    Raised if a received websocket frame cannot be decoded by its codec
+    """
+    pass
+
+
+class AbstractCodec(ABC):
+    # Websocket subprotocol clients use to choose this codec
+    SUBPROTOCOL: ClassVar[str]
+    # If this codec is sent via bytes frames (otherwise text frames)
+    BINARY: ClassVar[bool]
+
+    @staticmethod
+    @abstractmethod
+    def encode(content: dict[str, Any]) -> str | bytes:
+        """
+        Encodes serialized DTO data into a websocket frame
+
+        :param content: Serialized DTO data
+        :return: Text frame (str) or bytes frame (bytes)
+        """
+        ...
+
+    @staticmethod
+    @abstractmethod
+    def decode(data: str | bytes) -> dict[str, Any]:
+        """
+        Decodes a websocket frame into serialized DTO data
+
+        :param data: Websocket frame
+        :return: Serialized DTO data
+        :raises DecodeError: If the frame is malformed, or does not contain an object
+        """
+        ...
+
+
+def _expect_object(content: Any) -> dict[str, Any]:
+    if not isinstance(content, dict):
+        raise DecodeError(f'Expected an object, but received "{type(content).__name__}"')
+    return content
+
+
+class JsonCodec(AbstractCodec):
+    SUBPROTOCOL = 'messenger.json'
+    BINARY = False
+
+    if orjson is not None:
+        @staticmethod
+        def encode(content: dict[str, Any]) -> str:
+            return orjson.dumps(content).decode()
+
+        @staticmethod
+        def decode(data: str | bytes) -> dict[str, Any]:
+            try:
+                return _expect_object(orjson.loads(data))
+            except orjson.JSONDecodeError as error:
+                raise DecodeError(str(error)) from error
+    else:
+        @staticmethod
+        def encode(content: dict[str, Any]) -> str:
+            return json.dumps(content, separators=(',', ':'))
+
+        @staticmethod
+        def decode(data: str | bytes) -> dict[str, Any]:
+            try:
+                return _expect_object(json.loads(data))
+            except ValueError as error:  # Includes "UnicodeDecodeError" of bytes frames
+                raise DecodeError(str(error)) from error
+
+
+class MessagePackCodec(AbstractCodec):
+    SUBPROTOCOL = 'messenger.msgpack'
+    BINARY = True
+
+    @staticmethod
+    def encode(content: dict[str, Any]) -> bytes:
+        return msgpack.packb(content)
+
+    @staticmethod
+    def decode(data: str | bytes) -> dict[str, Any]:
+        try:
+            return _expect_object(msgpack.unpackb(data))
+        except (ValueError, TypeError, msgpack.UnpackException) as error:  # TypeError: Unhashable map key
+            raise DecodeError(str(error) or type(error).__name__) from error
+
+
+class CborCodec(AbstractCodec):
+    SUBPROTOCOL = 'messenger.cbor'
+    BINARY = True
+
+    @staticmethod
+    def encode(content: dict[str, Any]) -> bytes:
+        return cbor2.dumps(content)
+
+    @staticmethod
+    def decode(data: str | bytes) -> dict[str, Any]:
+        try:
+            return _expect_object(cbor2.loads(data))
+        except (ValueError, TypeError, cbor2.CBORDecodeError) as error:
+            raise DecodeError(str(error)) from error
+
+
+DEFAULT_CODEC: type[AbstractCodec] = JsonCodec
+
+# All codecs available in this environment, mapped by their subprotocol
+CODECS: dict[str, type[AbstractCodec]] = {
+    codec.SUBPROTOCOL: codec for codec in (JsonCodec, MessagePackCodec, CborCodec) if codec is not CborCodec or cbor2 is not None
+}
+
+
+def negotiate_codec(subprotocols: list[str]) -> tuple[type[AbstractCodec], Optional[str]]:
+    """
+    Chooses the first subprotocol requested by the client, that is supported by this server.
+
+    :param subprotocols: Subprotocols requested by the client (in order of its preference)
+    :return: Chosen codec and its subprotocol, or the default codec and "None" if no requested subprotocol is supported
+    """
+    for subprotocol in subprotocols:
+        codec = CODECS.get(subprotocol)
+        if codec is not None:
+            return codec, subprotocol
+    return DEFAULT_CODEC, None
+
+
+def encode_constant(codec: type[AbstractCodec], dto: AbstractMessageDTO) -> str | bytes:
+    """
+    Encodes a constant DTO (e.g. ``UnknownDTO``) only once per codec and returns the cached frame afterward.
+    Unhashable DTOs (with list fields) cannot be cached, they are encoded every time.
+
+    ATTENTION: Only use this for DTOs that are sent over and over again with the same content!
+
+    :param codec: Codec to encode with
+    :param dto: Immutable DTO
+    :return: Encoded frame
+    """
+    try:
+        hash(dto)
+    except TypeError:
+        return codec.encode(dto.serialize())
+    return _encode_cached(codec, dto)
+
+
+@lru_cache(maxsize=64)
+def _encode_cached(codec: type[AbstractCodec], dto: AbstractMessageDTO) -> str | bytes:
+    return codec.encode(dto.serialize())
@@ -0,0 +1,131 @@
+"""
+Process wide, lazily created connections to the in-memory database (Redis/Redict).
+
+The connection settings are taken from the ``MESSENGER_REDIS`` setting. If no URL is configured there, the first host
+of the default channel layer (``CHANNEL_LAYERS['default']['CONFIG']['hosts']``) is used, so the channel layer and this
+application always talk to the same in-memory database.
+
+Example::
+
+    MESSENGER_REDIS = {
+        'URL': 'redis://localhost:6379/0',  # Optional, defaults to the first channel layer host
+        'MAX_CONNECTIONS': 50,              # Maximum number of pooled connections per worker process
+        'HEALTH_CHECK_INTERVAL': 30,        # Idle connections are pinged after this many seconds before reuse
+    }
+
+For tests, use the URL ``fakeredis://`` to run against an in-process fake Redis
+(@see `fakeredis <https://github.com/cunla/fakeredis-py>`__).
+
+Synchronous code (e.g. views & signal receivers) uses its own, thread-safe client (@see ``get_sync_redis()``), that
+talks to the same in-memory database.
+
+@see `redis-py DOCs - Asyncio <https://redis.readthedocs.io/en/stable/examples/asyncio_examples.html>`__
+"""
+__all__ = ('get_redis', 'close_redis', 'get_sync_redis')
+
+import asyncio
+from threading import Lock
+from typing import Any, Optional
+from weakref import WeakKeyDictionary
+
+from channels_redis.utils import decode_hosts
+from django.conf import settings
+from django.core.exceptions import ImproperlyConfigured
+from redis import Redis as SyncRedis, ConnectionPool as SyncConnectionPool
+from redis.asyncio import Redis, ConnectionPool
+
+FAKE_REDIS_URL: str = 'fakeredis://'
+
+# NOTE: Asynchronous Redis connections are bound to the event loop that opened them. Under ASGI every worker process
+#       runs exactly one event loop, hence there is effectively one client (and one connection pool) per process.
+_CLIENTS: WeakKeyDictionary[asyncio.AbstractEventLoop, Redis] = WeakKeyDictionary()
+# NOTE: Synchronous connection pools are thread-safe, so one client is shared by all threads of the process
+_SYNC_CLIENT: Optional[SyncRedis] = None
+_SYNC_CLIENT_LOCK = Lock()
+# Fake database shared by the asynchronous & synchronous fake clients
+_FAKE_SERVER: Any = None
+
+
+def _get_configuration() -> dict[str, Any]:
+    return {
+        'URL': None,
+        'MAX_CONNECTIONS': 50,
+        'HEALTH_CHECK_INTERVAL': 30,
+    } | getattr(settings, 'MESSENGER_REDIS', {})
+
+
+def _get_channel_layer_host() -> dict[str, Any]:
+    layer_config: dict[str, Any] = getattr(settings, 'CHANNEL_LAYERS', {}).get('default', {}).get('CONFIG', {})
+    return decode_hosts(layer_config.get('hosts'))[0]
+
+
+def _get_fake_server() -> Any:
+    global _FAKE_SERVER
+    try:
+        from fakeredis import FakeServer
+    except ImportError as exc:
+        raise ImproperlyConfigured(f'Install "fakeredis" to use "{FAKE_REDIS_URL}" as Redis URL') from exc
+    if _FAKE_SERVER is None:
+        _FAKE_SERVER = FakeServer()
+    return _FAKE_SERVER
+
+
+def _create_client(synchronous: bool = False) -> Redis | SyncRedis:
+    configuration = _get_configuration()
+    pool_kwargs: dict[str, Any] = {
+        'max_connections': configuration['MAX_CONNECTIONS'],
+        'health_check_interval': configuration['HEALTH_CHECK_INTERVAL'],
+    }
+    client_class, pool_class = (SyncRedis, SyncConnectionPool) if synchronous else (Redis, ConnectionPool)
+    url = configuration['URL']
+    if url == FAKE_REDIS_URL:
+        from fakeredis import FakeRedis, FakeAsyncRedis
+        return (FakeRedis if synchronous else FakeAsyncRedis)(server=_get_fake_server())
+    if url is not None:
+        return client_class(connection_pool=pool_class.from_url(url, **pool_kwargs))
+    host = _get_channel_layer_host().copy()
+    address = host.pop('address', None)
+    host.pop('master_name', None)  # Sentinel setups are not supported (yet)
+    if address is not None:
+        return client_class(connection_pool=pool_class.from_url(address, **(host | pool_kwargs)))
+    return client_class(connection_pool=pool_class(**(host | pool_kwargs)))
+
+
+def get_redis() -> Redis:
+    """
+    Returns the pooled Redis client of this worker process. The client (and its pool) is created on first usage.
+
+    ATTENTION: Must be called from within a running event loop!
+
+    :return: Redis client
+    """
+    loop = asyncio.get_running_loop()
+    client = _CLIENTS.get(loop)
+    if client is None:
+        client = _CLIENTS[loop] = _create_client()
+    return client
+
+
+async def close_redis() -> None:
+    """
+    Closes the Redis client of the current event loop and disconnects all of its pooled connections.
+    """
+    client = _CLIENTS.pop(asyncio.get_running_loop(), None)
+    if client is not None:
+        await client.aclose(close_connection_pool=True)
+
+
+def get_sync_redis() -> SyncRedis:
+    """
+    Returns the pooled, synchronous Redis client of this process. The client (and its pool) is created on first usage.
+
+    ATTENTION: Blocks, never call this client from within a running event loop!
+
+    :return: Synchronous Redis client
+    """
+    global _SYNC_CLIENT
+    if _SYNC_CLIENT is None:
+        with _SYNC_CLIENT_LOCK:
+            if _SYNC_CLIENT is None:
+                _SYNC_CLIENT = _create_client(synchronous=True)
+    return _SYNC_CLIENT
@@ -58,7 +58,8 @@ class MessageType(IntEnum):
         :return: Message type enumeration
         :raise ValueError If given identifier does not fit with any known message type identifier
         """
-        for m_type in cls:
-            if m_type.value == identifier:
-                return m_type
-        raise ValueError(f'Unknown message type: {identifier}')
+        # NOTE: Enumeration lookup by value is a dictionary lookup, no need to iterate over all members
+        try:
+            return cls(identifier)
+        except ValueError:
+            raise ValueError(f'Unknown message type: {identifier}') from None
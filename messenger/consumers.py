@@ -1,147 +1,246 @@
-import datetime
-from abc import abstractmethod, ABC
+from abc import ABC
 from logging import getLogger
-from typing import Any, Optional
+from typing import Any, Awaitable, Callable, ClassVar, NamedTuple, Optional
 
 from channels.exceptions import DenyConnection
 from channels.generic.websocket import AsyncJsonWebsocketConsumer
 
+from messenger.admission import AdmissionRejected, get_admission_controller, RETRY_CLOSE_CODE
+from messenger.codecs import AbstractCodec, DecodeError, JsonCodec, DEFAULT_CODEC, negotiate_codec, encode_constant
 from messenger.constants import MessageType, MESSAGE_TYPE_KEYWORD
-from messenger.dto import UnknownDTO, NotificationDTO, ErrorDTO
-from messenger.models import Notification, ChannelUser
+from messenger.counters import get_counter_cache
+from messenger.dto import AbstractMessageDTO, DTOValidationError, UnknownDTO, NotificationDTO, ErrorDTO
+from messenger.metrics import CONSUMER_PHASE_SECONDS, timed
+from messenger.models import ChannelUser
+from messenger.outbound import OutboundQueue
+from messenger.presence import AbstractPresenceRegistry, get_presence_registry
 
 LOGGER = getLogger(__name__)
 
+UNKNOWN_DTO = UnknownDTO()
+# Error code sent back, if a received message does not match the fields of its DTO
+INVALID_MESSAGE_ERROR_CODE: int = 400
+
+
+class MessageHandler(NamedTuple):
+    message_type: MessageType
+    dto_class: type[AbstractMessageDTO]
+    function: Callable[[Any, AbstractMessageDTO], Awaitable[None]]
+
+
+def message_handler(message_type: MessageType, dto_class: type[AbstractMessageDTO]):
+    """
+    Registers the decorated consumer method as handler for all received messages of the given type.
+    The received data is deserialized into the given DTO, before it is passed to the handler.
+
+    Example::
+
+        class MyConsumer(MessengerConsumer):
+
+            @message_handler(MessageType.ALERT, AlertDTO)
+            async def handle_alert(self, dto: AlertDTO) -> None:
+                ...
+
+    :param message_type: Message type to handle
+    :param dto_class: DTO class the received data is deserialized into
+    """
+    def decorator(function: Callable[[Any, AbstractMessageDTO], Awaitable[None]]):
+        function.message_handler = MessageHandler(message_type, dto_class, function)
+        return function
+    return decorator
+
 
 class MessengerConsumer(AsyncJsonWebsocketConsumer, ABC):
+    # Message type identifiers mapping to their handler (@see message_handler), collected on class creation
+    message_handlers: ClassVar[dict[int, MessageHandler]] = {}
+    # Dotted path of the presence registry, "None" uses the backend configured in the "MESSENGER_PRESENCE" setting
+    # @see messenger.presence.get_presence_registry
+    presence_backend: ClassVar[Optional[str]] = None
+    # Coalesces outgoing notification updates (@see messenger.outbound), created on connect
+    outbound: Optional[OutboundQueue[str | bytes]] = None
+    # Wire format negotiated with the client on connect (@see messenger.codecs)
+    codec: type[AbstractCodec] = DEFAULT_CODEC
+    # Handshake was rejected by the admission control, so the channel never joined its group nor the presence registry
+    rejected: bool = False
+
+    def __init_subclass__(cls, **kwargs) -> None:
+        super().__init_subclass__(**kwargs)
+        handlers: dict[int, MessageHandler] = {}
+        # NOTE: Handlers of subclasses overwrite handlers of their parents
+        for klass in reversed(cls.__mro__):
+            for attribute in vars(klass).values():
+                handler: Optional[MessageHandler] = getattr(attribute, 'message_handler', None)
+                if isinstance(handler, MessageHandler):
+                    handlers[int(handler.message_type)] = handler
+        cls.message_handlers = handlers
+
+    @classmethod
+    def get_presence_registry(cls) -> AbstractPresenceRegistry:
+        return get_presence_registry(cls.presence_backend)
 
-    @abstractmethod
     async def remember_group(self, channel_name: str) -> None:
-        ...
+        current_user: ChannelUser = self.scope['user']
+        await self.get_presence_registry().register(channel_name, current_user.get_channel_name())
 
-    @abstractmethod
     async def forget_group(self, channel_name: str) -> None:
-        ...
+        await self.get_presence_registry().unregister(channel_name)
 
-    @abstractmethod
-    async def group_exists(self, channel_name: str) -> bool:
-        ...
+    @classmethod
+    async def group_exists(cls, channel_name: str) -> bool:
+        return await cls.get_presence_registry().exists(channel_name)
 
     async def connect(self) -> None:
+        # NOTE: The user was already loaded by the middleware (@see messenger.middleware.TimedAuthMiddleware)
         current_user: ChannelUser = self.scope['user']
         if current_user.is_anonymous:
             raise DenyConnection('Unauthorized user')
-        else:
-            now = datetime.datetime.now()
-            await self.channel_layer.group_add(
-                current_user.get_channel_name(),
-                self.channel_name
-            )
-            exec_time = (datetime.datetime.now() - now)
-            print(f'CONNECT: {exec_time.total_seconds()}s')
-            await self.accept()
-            await self.remember_group(self.channel_name)
+        self.codec, subprotocol = negotiate_codec(self.scope.get('subprotocols', []))
+        admission = get_admission_controller()
+        try:
+            with timed(CONSUMER_PHASE_SECONDS, handler='connect', phase='admission'):
+                await admission.acquire()
+        except AdmissionRejected as rejected:
+            # NOTE: The close code only reaches the client after the handshake, rejecting before results in HTTP 403
+            self.rejected = True
+            await self.accept(subprotocol)
+            await self.close(code=RETRY_CLOSE_CODE, reason=f'retry-after:{rejected.retry_after}')
+            return
+        # NOTE: Must exist before the channel joins its group, since notifications may arrive from then on
+        self.outbound = OutboundQueue(self.send_frame)
+        try:
+            with timed(CONSUMER_PHASE_SECONDS, handler='connect', phase='group_add'):
+                await self.channel_layer.group_add(
+                    current_user.get_channel_name(),
+                    self.channel_name
+                )
+            with timed(CONSUMER_PHASE_SECONDS, handler='connect', phase='accept'):
+                await self.accept(subprotocol)
+            with timed(CONSUMER_PHASE_SECONDS, handler='connect', phase='remember_group'):
+                await self.remember_group(self.channel_name)
+        finally:
+            admission.release()
 
     async def disconnect(self, close_code: int):
         current_user: ChannelUser = self.scope['user']
-        if not current_user.is_anonymous:
-            await self.forget_group(self.channel_name)
-            await self.channel_layer.group_discard(
-                current_user.get_channel_name(),
-                self.channel_name
-            )
+        if self.outbound is not None:
+            self.outbound.close()
+        # NOTE: Rejected channels were never registered, so they must not cost any round trips to the in-memory database
+        if not current_user.is_anonymous and not self.rejected:
+            with timed(CONSUMER_PHASE_SECONDS, handler='disconnect', phase='forget_group'):
+                await self.forget_group(self.channel_name)
+            with timed(CONSUMER_PHASE_SECONDS, handler='disconnect', phase='group_discard'):
+                await self.channel_layer.group_discard(
+                    current_user.get_channel_name(),
+                    self.channel_name
+                )
+
+    async def receive(self, text_data: Optional[str] = None, bytes_data: Optional[bytes] = None, **kwargs) -> None:
+        # NOTE: Text frames are always JSON, bytes frames use the negotiated binary wire format
+        try:
+            if text_data is not None:
+                content = JsonCodec.decode(text_data)
+            elif self.codec.BINARY:
+                content = self.codec.decode(bytes_data)
+            else:
+                raise DecodeError('Bytes frame received, but no binary wire format was negotiated!')
+        except DecodeError as error:
+            LOGGER.error(f'Undecodable message from user "{self.scope['user']}": {error}')
+            await self.send_json(ErrorDTO(INVALID_MESSAGE_ERROR_CODE, str(error)).serialize())
+            return
+        await self.receive_json(content, **kwargs)
+
+    async def send_json(self, content: dict[str, Any], close: bool = False) -> None:
+        await self.send_frame(self.codec.encode(content), close)
+
+    async def send_frame(self, frame: str | bytes, close: bool = False) -> None:
+        """
+        Sends an already encoded frame (@see messenger.codecs)
+
+        :param frame: Text frame (str) or bytes frame (bytes)
+        :param close: Close websocket after sending the frame
+        """
+        if isinstance(frame, bytes):
+            await self.send(bytes_data=frame, close=close)
+        else:
+            await self.send(text_data=frame, close=close)
+
+    @classmethod
+    async def decode_json(cls, text_data: str) -> dict[str, Any]:
+        return JsonCodec.decode(text_data)
+
+    @classmethod
+    async def encode_json(cls, content: dict[str, Any]) -> str:
+        return JsonCodec.encode(content)
 
     async def receive_json(self, content: dict[str, Any], **kwargs):
-        try:
-            message_type: Optional[MessageType] = MessageType.get_message_type(content[MESSAGE_TYPE_KEYWORD])
-        except ValueError:
-            message_type: Optional[MessageType] = None
-        match message_type:
-            case MessageType.UNKNOWN:
-                # User didn't understand last sent message type
-                LOGGER.error(f'Last message sent to user "{self.scope['user']}" could NOT be processed, since he did not know the used message type!')
-            case MessageType.ERROR:
-                # User threw error
-                error_dto = ErrorDTO.deserialize(content)
-                LOGGER.error(f'User threw error.\n\tERROR CODE: {error_dto.error_code}\n\tERROR MESSAGE: {error_dto.error_message}')
-            case MessageType.NOTIFICATION:
-                # User wants a notification update
-                current_user: ChannelUser = self.scope['user']
-                notifications: Notification = await Notification.objects.aget(user=current_user)
-                await self.send_json(NotificationDTO(notifications.unread_messages).serialize())
-            case MessageType.USER_TEXT_MESSAGE:
-                # User wants to send a text message to other user
-                raise NotImplementedError('User text message type currently not supported')
-            case MessageType.GROUP_TEXT_MESSAGE:
-                # User wants to send a text message to multiple other users
-                raise NotImplementedError('Group text message type currently not supported')
-            case MessageType.ALERT:
-                # User wants..., ?!?
-                raise NotImplementedError('Alert message type currently not supported')
-            case _:
+        message_type = content.get(MESSAGE_TYPE_KEYWORD)
+        # NOTE: Type-exact, "true" or "2.0" equal (and hash like) the integer message types, but are no message types
+        handler: Optional[MessageHandler] = self.message_handlers.get(message_type) if type(message_type) is int else None
+        if handler is None:
+            with timed(CONSUMER_PHASE_SECONDS, handler='receive_json', phase='INVALID'):
                 LOGGER.error(f'Unknown message type "{message_type}" from user "{self.scope['user']}"')
-                await self.send_json(UnknownDTO().serialize())
+                await self.send_frame(encode_constant(self.codec, UNKNOWN_DTO))
+        else:
+            with timed(CONSUMER_PHASE_SECONDS, handler='receive_json', phase=handler.message_type.name):
+                try:
+                    dto = handler.dto_class.deserialize(content)
+                except DTOValidationError as error:
+                    LOGGER.error(f'Invalid message from user "{self.scope['user']}": {error}')
+                    await self.send_json(ErrorDTO(INVALID_MESSAGE_ERROR_CODE, str(error)).serialize())
+                    return
+                await handler.function(self, dto)
+
+    @message_handler(MessageType.UNKNOWN, UnknownDTO)
+    async def handle_unknown(self, dto: UnknownDTO) -> None:
+        # User didn't understand last sent message type
+        LOGGER.error(f'Last message sent to user "{self.scope['user']}" could NOT be processed, since he did not know the used message type!')
+
+    @message_handler(MessageType.ERROR, ErrorDTO)
+    async def handle_error(self, dto: ErrorDTO) -> None:
+        # User threw error
+        LOGGER.error(f'User threw error.\n\tERROR CODE: {dto.error_code}\n\tERROR MESSAGE: {dto.error_message}')
+
+    @message_handler(MessageType.NOTIFICATION, NotificationDTO)
+    async def handle_notification(self, dto: NotificationDTO) -> None:
+        # User wants a notification update
+        current_user: ChannelUser = self.scope['user']
+        unread_messages = await get_counter_cache().get_unread_messages(current_user.pk)
+        # NOTE: Replaces any older pending notification update, which would otherwise be sent after this fresher one
+        self.outbound.push(MessageType.NOTIFICATION, self.codec.encode(NotificationDTO(unread_messages).serialize()))
 
     # NOTE: Function name must be same as the "type" in "message.signals.notification" function
     async def send_notification(self, data: dict[str, Any]) -> None:
-        if await self.group_exists(self.channel_name):
-            await self.send_json(data['dto'].serialize())
+        """
+        Forwards a notification update, that was encoded once by the sender (@see messenger.signals.encode_event)
+
+        :param data: Channel layer event
+        """
+        with timed(CONSUMER_PHASE_SECONDS, handler='send_notification', phase='group_exists'):
+            exists = await self.group_exists(self.channel_name)
+        if exists:
+            with timed(CONSUMER_PHASE_SECONDS, handler='send_notification', phase='enqueue'):
+                # JSON clients get the pre-encoded frame unchanged, only binary clients re-encode it in their wire format
+                frame = data['frame'] if self.codec is JsonCodec else self.codec.encode(JsonCodec.decode(data['frame']))
+                self.outbound.push(MessageType(data['message_type']), frame)
 
 
 class MessengerConsumerDevelopment(MessengerConsumer):
     """
+    Remembers the connected channels only within this worker process.
+
     @see https://channels.readthedocs.io/en/latest/topics/channel_layers.html#single-channels
     """
-
-    _GROUPS: dict[str, int] = {}
+    presence_backend = 'messenger.presence.InMemoryPresenceRegistry'
 
     def __init__(self, *args, **kwargs):
         super().__init__(args, kwargs)
 
-    async def remember_group(self, channel_name: str) -> None:
-        number_of_users = self._GROUPS.get(channel_name, 0)
-        self._GROUPS[channel_name] = number_of_users + 1
-
-    async def forget_group(self, channel_name: str) -> None:
-        number_of_users = self._GROUPS.get(channel_name, 0)
-        if number_of_users > 1:
-            self._GROUPS[channel_name] = number_of_users - 1
-        else:
-            self._GROUPS.pop(channel_name, None)
-
-    @classmethod
-    async def group_exists(cls, channel_name: str) -> bool:
-        return channel_name in cls._GROUPS.keys()
-
 
 class MessengerConsumerProduction(MessengerConsumer):
     """
+    Remembers the connected channels in the presence registry configured in the "MESSENGER_PRESENCE" setting
+    (by default shared by all worker processes via the in-memory database).
+
     @see https://channels.readthedocs.io/en/latest/topics/channel_layers.html#single-channels
+    @see :mod:`messenger.presence`
     """
-
-    async def remember_group(self, channel_name: str) -> None:
-        # In memory DB
-        # TODO...
-        redis = await aioredis.create_redis_pool('redis://localhost')
-        await redis.sadd(f"group_{channel_name}_members", self.channel_name)
-        redis.close()
-        await redis.wait_closed()
-
-    async def forget_group(self, channel_name: str) -> None:
-        assert False, 'INSTALL REDDIS TO USE THIS'
-        # In memory DB
-        # TODO...
-        redis = await aioredis.create_redis_pool('redis://localhost')
-        await redis.srem(f"group_{channel_name}_members", self.channel_name)
-        redis.close()
-        await redis.wait_closed()
-
-    async def group_exists(self, channel_name: str) -> bool:
-        assert False, 'INSTALL REDDIS TO USE THIS'
-        # In memory DB
-        # TODO...
-        redis = await aioredis.create_redis_pool('redis://localhost')
-        group_members = await redis.smembers(f"group_{group_name}_members")
-        redis.close()
-        await redis.wait_closed()
-        return len(group_members) > 0
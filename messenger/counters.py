@@ -0,0 +1,261 @@
+"""
+Write-through cache of the unread messages counters of all users, so the counter of a (re)connecting user is read
+without touching the database.
+
+The cache is written after every committed counter change (@see :func:`messenger.signals.schedule_notifications`),
+with the same counters that are pushed to the users. Every counter is cached along with the version of the inbox, that
+was read in the same query (@see :class:`messenger.inbox.InboxVersion`), and is only overwritten by a counter of the
+same or a newer version. So the write-through of concurrent commits may finish in any order, the counter read last
+(after the last commit) always stays cached. A counter missing in the cache is read from the database once and cached
+afterward. Drift between cache, database and the actual unread messages is repaired by the
+``reconcile_counter_cache`` management command.
+
+Configuration example::
+
+    MESSENGER_COUNTERS = {
+        'BACKEND': 'messenger.counters.RedisCounterCache',
+        'CHUNK_SIZE': 500,
+    }
+"""
+__all__ = ('VersionedCounter', 'AbstractCounterCache', 'InMemoryCounterCache', 'RedisCounterCache', 'get_counter_cache')
+
+from abc import ABC, abstractmethod
+from threading import Lock
+from typing import Any, Iterable, Mapping, NamedTuple, Optional
+
+from django.conf import settings
+from django.utils.module_loading import import_string
+from redis import Redis
+from redis.client import Pipeline
+
+from messenger.connections import get_redis, get_sync_redis
+from messenger.metrics import REGISTRY, Counter
+from messenger.models import Notification, chunked
+
+
+def _get_configuration() -> dict[str, Any]:
+    return {
+        'BACKEND': 'messenger.counters.RedisCounterCache',
+        'CHUNK_SIZE': 500,
+    } | getattr(settings, 'MESSENGER_COUNTERS', {})
+
+
+COUNTER_CACHE_LOOKUPS = REGISTRY.register(Counter(
+    'messenger_counter_cache_lookups_total',
+    'Lookups of the unread messages counter cache by result (hit/miss)',
+    ('result', ),
+))
+
+
+class VersionedCounter(NamedTuple):
+    unread_messages: int
+    # Version of the inbox, read in the same query as the counter (@see messenger.models.Notification.inbox_version)
+    version: int
+
+
+class AbstractCounterCache(ABC):
+    """
+    ATTENTION: The asynchronous functions are meant for consumers & asynchronous views,
+               the synchronous ones for signal receivers & commands.
+    """
+
+    async def get_unread_messages(self, user_pk: int) -> int:
+        """
+        Returns the cached counter of the given user. Only on a cache miss the counter is read from the database.
+
+        :param user_pk: Primary key of the user
+        :return: Number of unread messages
+        """
+        unread_messages = await self.get(user_pk)
+        if unread_messages is not None:
+            COUNTER_CACHE_LOOKUPS.inc(result='hit')
+            return unread_messages
+        COUNTER_CACHE_LOOKUPS.inc(result='miss')
+        counter = VersionedCounter(*await Notification.objects.values_list('unread_messages', 'inbox_version').aget(user_id=user_pk))
+        await self.add(user_pk, counter)
+        return counter.unread_messages
+
+    @abstractmethod
+    async def get(self, user_pk: int) -> Optional[int]:
+        """
+        :param user_pk: Primary key of the user
+        :return: Cached counter, or "None" if the counter is not cached
+        """
+        ...
+
+    @abstractmethod
+    async def add(self, user_pk: int, counter: VersionedCounter) -> None:
+        """
+        Caches the given counter, but only if no counter is cached for this user yet.
+
+        NOTE: Never overwrites a counter, that was written through concurrently with a (newer) committed value.
+
+        :param user_pk: Primary key of the user
+        :param counter: Number of unread messages & version of the inbox
+        """
+        ...
+
+    @abstractmethod
+    def get_many(self, user_pks: Iterable[int]) -> dict[int, Optional[int]]:
+        """
+        :param user_pks: Primary keys of users
+        :return: Primary keys of the given users mapping to their cached counter, or "None" if the counter is not cached
+        """
+        ...
+
+    @abstractmethod
+    def set_many(self, counters: Mapping[int, VersionedCounter]) -> None:
+        """
+        Writes the given (committed) counters through to the cache. Every cached counter is only overwritten, if the
+        given one has the same or a newer version.
+
+        NOTE: Of counters with the same version, the one read last is the newest. But then, a commit in between bumps
+              the version once more afterward, and writes through its counter as well.
+
+        :param counters: Primary keys of users mapping to their number of unread messages & version of their inbox
+        """
+        ...
+
+    @abstractmethod
+    def delete_many(self, user_pks: Iterable[int]) -> None:
+        """
+        Removes the cached counters of the given users, so they are read from the database again on the next lookup.
+
+        :param user_pks: Primary keys of users
+        """
+        ...
+
+
+class InMemoryCounterCache(AbstractCounterCache):
+    """
+    Counter cache within this worker process only, e.g. for development with a single process.
+    """
+
+    def __init__(self) -> None:
+        self._counters: dict[int, VersionedCounter] = {}
+        # NOTE: Written from the threads of synchronous views as well
+        self._lock = Lock()
+
+    async def get(self, user_pk: int) -> Optional[int]:
+        counter = self._counters.get(user_pk)
+        return None if counter is None else counter.unread_messages
+
+    async def add(self, user_pk: int, counter: VersionedCounter) -> None:
+        with self._lock:
+            self._counters.setdefault(user_pk, counter)
+
+    def get_many(self, user_pks: Iterable[int]) -> dict[int, Optional[int]]:
+        counters = {user_pk: self._counters.get(user_pk) for user_pk in user_pks}
+        return {user_pk: None if counter is None else counter.unread_messages for user_pk, counter in counters.items()}
+
+    def set_many(self, counters: Mapping[int, VersionedCounter]) -> None:
+        with self._lock:
+            for user_pk, counter in counters.items():
+                cached = self._counters.get(user_pk)
+                if cached is None or cached.version <= counter.version:
+                    self._counters[user_pk] = counter
+
+    def delete_many(self, user_pks: Iterable[int]) -> None:
+        with self._lock:
+            for user_pk in user_pks:
+                self._counters.pop(user_pk, None)
+
+
+class RedisCounterCache(AbstractCounterCache):
+    """
+    Counter cache shared by all worker processes. Every counter is kept in its own key (as "<version>:<counter>"), in
+    the same in-memory database as the channel layer. The write-through compares the versions within optimistic
+    transactions (WATCH/MULTI), one per chunk of at most ``CHUNK_SIZE`` counters, that only watch the keys of their
+    counters. So a concurrent write of one counter only repeats the (small) transaction of its chunk.
+
+    @see :func:`messenger.connections.get_redis`
+    @see :func:`messenger.connections.get_sync_redis`
+    """
+    KEY_PREFIX: str = 'messenger:counter:'
+
+    @classmethod
+    def _get_key(cls, user_pk: int) -> str:
+        return f'{cls.KEY_PREFIX}{user_pk}'
+
+    @staticmethod
+    def _encode(counter: VersionedCounter) -> str:
+        return f'{counter.version}:{counter.unread_messages}'
+
+    @staticmethod
+    def _decode(value: Optional[bytes]) -> Optional[VersionedCounter]:
+        if value is None:
+            return None
+        version, unread_messages = value.split(b':')
+        return VersionedCounter(int(unread_messages), int(version))
+
+    @classmethod
+    def _get_newer(cls, counters: Mapping[int, VersionedCounter], cached: list[Optional[bytes]]) -> dict[str, str]:
+        """
+        :return: Keys mapping to the encoded counters, that have the same or a newer version than the cached ones
+        """
+        newer: dict[str, str] = {}
+        for (user_pk, counter), value in zip(counters.items(), cached):
+            cached_counter = cls._decode(value)
+            if cached_counter is None or cached_counter.version <= counter.version:
+                newer[cls._get_key(user_pk)] = cls._encode(counter)
+        return newer
+
+    async def get(self, user_pk: int) -> Optional[int]:
+        counter = self._decode(await get_redis().get(self._get_key(user_pk)))
+        return None if counter is None else counter.unread_messages
+
+    async def add(self, user_pk: int, counter: VersionedCounter) -> None:
+        await get_redis().set(self._get_key(user_pk), self._encode(counter), nx=True)
+
+    def get_many(self, user_pks: Iterable[int]) -> dict[int, Optional[int]]:
+        user_pks = list(user_pks)
+        if not user_pks:
+            return {}
+        values: list[Optional[bytes]] = get_sync_redis().mget([self._get_key(user_pk) for user_pk in user_pks])
+        counters = (self._decode(value) for value in values)
+        return {user_pk: None if counter is None else counter.unread_messages for user_pk, counter in zip(user_pks, counters)}
+
+    def set_many(self, counters: Mapping[int, VersionedCounter]) -> None:
+        redis = get_sync_redis()
+        for chunk in chunked(counters, _get_configuration()['CHUNK_SIZE']):
+            self._compare_and_set(redis, {user_pk: counters[user_pk] for user_pk in chunk})
+
+    def _compare_and_set(self, redis: Redis, counters: Mapping[int, VersionedCounter]) -> None:
+        """
+        Writes the given counters, unless a newer version of them is cached already
+
+        :param redis: Synchronous Redis client
+        :param counters: Chunk of counters, all of them are watched within one transaction
+        """
+        keys = [self._get_key(user_pk) for user_pk in counters]
+
+        def compare_and_set(pipe: Pipeline) -> None:
+            # NOTE: Runs again, if any of the counters was written concurrently in between
+            newer = self._get_newer(counters, pipe.mget(keys))
+            pipe.multi()
+            if newer:
+                pipe.mset(newer)
+
+        redis.transaction(compare_and_set, *keys)
+
+    def delete_many(self, user_pks: Iterable[int]) -> None:
+        keys = [self._get_key(user_pk) for user_pk in user_pks]
+        if keys:
+            get_sync_redis().delete(*keys)
+
+
+_CACHES: dict[str, AbstractCounterCache] = {}
+
+
+def get_counter_cache(backend: Optional[str] = None) -> AbstractCounterCache:
+    """
+    Returns the counter cache of this worker process
+
+    :param backend: Dotted path of the cache class, defaults to the ``BACKEND`` of the ``MESSENGER_COUNTERS`` setting
+    :return: Counter cache
+    """
+    backend = backend or _get_configuration()['BACKEND']
+    cache = _CACHES.get(backend)
+    if cache is None:
+        cache = _CACHES[backend] = import_string(backend)()
+    return cache
@@ -0,0 +1,255 @@
+"""
+Cache of rendered template fragments of messages, so large inboxes are not rendered row by row for every request.
+
+Message rows (@see ``messenger/fragments/message-row.html``) are cached by message type, id & read state, message
+bodies (@see ``messenger/fragments/message-body.html``) by message type & id. Both also depend on the active language &
+time zone. All rows of a page are looked up at once, and only the missing ones are rendered. The fragments of a message
+are invalidated after it was saved or deleted (@see :func:`messenger.signals.outdated_message_fragments`).
+
+NOTE: Invalidations only reach the fragments of other worker processes through a shared cache (the default). Outdated
+      fragments of the LRU cache (single process setups only) are served by other processes until they expire.
+
+Configuration example::
+
+    MESSENGER_FRAGMENTS = {
+        'BACKEND': 'messenger.fragments.SharedFragmentCache',
+        'CACHE': 'default',     # Alias of the Django cache of 'messenger.fragments.SharedFragmentCache'
+        'MAX_ENTRIES': 10000,   # Maximum number of fragments of 'messenger.fragments.LRUFragmentCache'
+        'TIMEOUT': 300,         # Seconds a fragment is cached at most
+        'VERSION': 1,           # Increment after changing a fragment template, so no outdated fragments are served
+    }
+"""
+__all__ = (
+    'AbstractFragmentCache', 'LRUFragmentCache', 'SharedFragmentCache', 'get_fragment_cache', 'render_message_rows',
+    'render_message_body', 'invalidate_message',
+)
+
+from abc import ABC, abstractmethod
+from collections import OrderedDict
+from threading import Lock
+from time import monotonic
+from typing import Any, ClassVar, Iterable, Mapping, Optional
+
+from django.conf import settings
+from django.core.cache import caches
+from django.template.loader import get_template
+from django.utils.module_loading import import_string
+from django.utils.timezone import get_current_timezone_name
+from django.utils.translation import get_language
+
+from messenger.constants import MessageType
+from messenger.metrics import REGISTRY, Counter
+
+MESSAGE_ROW_TEMPLATE = 'messenger/fragments/message-row.html'
+MESSAGE_BODY_TEMPLATE = 'messenger/fragments/message-body.html'
+
+
+def _get_configuration() -> dict[str, Any]:
+    return {
+        'BACKEND': 'messenger.fragments.SharedFragmentCache',
+        'CACHE': 'default',
+        'MAX_ENTRIES': 10000,
+        'TIMEOUT': 300,
+        'VERSION': 1,
+    } | getattr(settings, 'MESSENGER_FRAGMENTS', {})
+
+
+FRAGMENT_CACHE_LOOKUPS = REGISTRY.register(Counter(
+    'messenger_fragment_cache_lookups_total',
+    'Lookups of the template fragment cache by fragment (row/body) & result (hit/miss)',
+    ('fragment', 'result'),
+))
+
+
+class AbstractFragmentCache(ABC):
+    # Lookups wait for network I/O, so asynchronous views render in a thread (@see messenger.views.AsyncTemplateView)
+    BLOCKING: ClassVar[bool]
+
+    @abstractmethod
+    def get_many(self, keys: Iterable[str]) -> dict[str, str]:
+        """
+        :param keys: Keys of fragments
+        :return: Keys of all cached fragments mapping to the rendered fragment, missing fragments are left out
+        """
+        ...
+
+    @abstractmethod
+    def set_many(self, fragments: Mapping[str, str]) -> None:
+        """
+        :param fragments: Keys of fragments mapping to the rendered fragment
+        """
+        ...
+
+    @abstractmethod
+    def delete_many(self, keys: Iterable[str]) -> None:
+        """
+        :param keys: Keys of fragments
+        """
+        ...
+
+
+class LRUFragmentCache(AbstractFragmentCache):
+    """
+    Fragment cache within this worker process only. The least recently used fragments are evicted first, and every
+    fragment expires after the configured timeout.
+
+    ATTENTION: Only for single process setups. Messages are invalidated in the process, that changed them, so all other
+               processes serve outdated fragments until they expire.
+    """
+    BLOCKING = False
+
+    def __init__(self, max_entries: Optional[int] = None, timeout: Optional[float] = None) -> None:
+        configuration = _get_configuration()
+        self.max_entries: int = max_entries or configuration['MAX_ENTRIES']
+        self.timeout: float = timeout or configuration['TIMEOUT']
+        # Keys mapping to the point in time the fragment expires & the fragment
+        self._fragments: OrderedDict[str, tuple[float, str]] = OrderedDict()
+        # NOTE: Used from the threads of synchronous views as well
+        self._lock = Lock()
+
+    def get_many(self, keys: Iterable[str]) -> dict[str, str]:
+        fragments: dict[str, str] = {}
+        now = monotonic()
+        with self._lock:
+            for key in keys:
+                entry = self._fragments.get(key)
+                if entry is None:
+                    continue
+                expires_at, fragment = entry
+                if expires_at <= now:
+                    del self._fragments[key]
+                    continue
+                self._fragments.move_to_end(key)
+                fragments[key] = fragment
+        return fragments
+
+    def set_many(self, fragments: Mapping[str, str]) -> None:
+        expires_at = monotonic() + self.timeout
+        with self._lock:
+            for key, fragment in fragments.items():
+                self._fragments[key] = (expires_at, fragment)
+                self._fragments.move_to_end(key)
+            while len(self._fragments) > self.max_entries:
+                self._fragments.popitem(last=False)
+
+    def delete_many(self, keys: Iterable[str]) -> None:
+        with self._lock:
+            for key in keys:
+                self._fragments.pop(key, None)
+
+
+class SharedFragmentCache(AbstractFragmentCache):
+    """
+    Fragment cache shared by all worker processes, backed by a Django cache (e.g. Redis or Memcached).
+    Eviction is left to the Django cache.
+
+    NOTE: Templates are rendered synchronously, so asynchronous views render templates with fragments of this cache in
+          a thread, instead of waiting for the cache within the event loop.
+    """
+    BLOCKING = True
+
+    def __init__(self, alias: Optional[str] = None, timeout: Optional[float] = None) -> None:
+        configuration = _get_configuration()
+        self.alias: str = alias or configuration['CACHE']
+        self.timeout: float = timeout or configuration['TIMEOUT']
+
+    def get_many(self, keys: Iterable[str]) -> dict[str, str]:
+        return caches[self.alias].get_many(list(keys))
+
+    def set_many(self, fragments: Mapping[str, str]) -> None:
+        if fragments:
+            caches[self.alias].set_many(fragments, timeout=self.timeout)
+
+    def delete_many(self, keys: Iterable[str]) -> None:
+        caches[self.alias].delete_many(list(keys))
+
+
+_CACHES: dict[str, AbstractFragmentCache] = {}
+
+
+def get_fragment_cache(backend: Optional[str] = None) -> AbstractFragmentCache:
+    """
+    Returns the fragment cache of this worker process
+
+    :param backend: Dotted path of the cache class, defaults to the ``BACKEND`` of the ``MESSENGER_FRAGMENTS`` setting
+    :return: Fragment cache
+    """
+    backend = backend or _get_configuration()['BACKEND']
+    cache = _CACHES.get(backend)
+    if cache is None:
+        cache = _CACHES[backend] = import_string(backend)()
+    return cache
+
+
+def _get_row_key(message_type: MessageType, identifier: int, read: bool, language: str, time_zone: str) -> str:
+    return f'messenger:fragment:{_get_configuration()["VERSION"]}:row:{int(message_type)}:{identifier}:{int(read)}:{language}:{time_zone}'
+
+
+def _get_body_key(message_type: MessageType, identifier: int, language: str, time_zone: str) -> str:
+    return f'messenger:fragment:{_get_configuration()["VERSION"]}:body:{int(message_type)}:{identifier}:{language}:{time_zone}'
+
+
+def _render_cached(fragment: str, template_name: str, contexts: Mapping[str, dict[str, Any]]) -> dict[str, str]:
+    """
+    Looks up all given fragments at once, and renders & caches only the missing ones.
+
+    :param fragment: Name of the fragment (for metrics)
+    :param template_name: Template of the fragment
+    :param contexts: Keys of fragments mapping to the context to render the fragment with
+    :return: Keys of fragments mapping to the rendered fragment
+    """
+    cache = get_fragment_cache()
+    fragments = cache.get_many(contexts.keys())
+    missing = {key: context for key, context in contexts.items() if key not in fragments}
+    FRAGMENT_CACHE_LOOKUPS.inc(len(fragments), fragment=fragment, result='hit')
+    if missing:
+        FRAGMENT_CACHE_LOOKUPS.inc(len(missing), fragment=fragment, result='miss')
+        template = get_template(template_name)
+        rendered = {key: template.render(context) for key, context in missing.items()}
+        cache.set_many(rendered)
+        fragments.update(rendered)
+    return fragments
+
+
+def render_message_rows(messages: Iterable[Any]) -> str:
+    """
+    :param messages: Messages of the inbox (@see :class:`messenger.inbox.MessageMetaData`)
+    :return: Rendered table rows of all given messages
+    """
+    language, time_zone = get_language(), get_current_timezone_name()
+    contexts: dict[str, dict[str, Any]] = {
+        _get_row_key(message.message_type, message.id, message.received, language, time_zone): {
+            'message': message,
+            'user_message_type': MessageType.USER_TEXT_MESSAGE,
+            'group_message_type': MessageType.GROUP_TEXT_MESSAGE,
+        } for message in messages
+    }
+    fragments = _render_cached('row', MESSAGE_ROW_TEMPLATE, contexts)
+    return ''.join(fragments[key] for key in contexts)
+
+
+def render_message_body(message: Any) -> str:
+    """
+    :param message: User or group message (@see :class:`messenger.models.AbstractMessageType`)
+    :return: Rendered body of the given message
+    """
+    key = _get_body_key(message.message_type(), message.pk, get_language(), get_current_timezone_name())
+    return _render_cached('body', MESSAGE_BODY_TEMPLATE, {key: {'message': message}})[key]
+
+
+def invalidate_message(message_type: MessageType, identifier: int) -> None:
+    """
+    Removes all cached fragments of the given message, in every language & read state.
+
+    NOTE: Fragments rendered in a time zone other than the default one are only removed by expiration (or eviction).
+
+    :param message_type: Type of the message
+    :param identifier: Primary key of the message
+    """
+    languages = {settings.LANGUAGE_CODE, *(code for code, name in settings.LANGUAGES)}
+    time_zone = settings.TIME_ZONE
+    keys = [_get_body_key(message_type, identifier, language, time_zone) for language in languages]
+    keys.extend(
+        _get_row_key(message_type, identifier, read, language, time_zone) for read in (False, True) for language in languages
+    )
+    get_fragment_cache().delete_many(keys)
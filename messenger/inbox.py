@@ -0,0 +1,283 @@
+"""
+Unified inbox of a user, that lists his user & group messages together.
+
+Both message types are merged in creation order by the database (one ``UNION`` query), the read state is annotated
+in SQL and the ``content`` column is never loaded. Pages are addressed by keyset cursors on
+(``created``, message type, ``id``) instead of offsets, so every page costs the same, no matter how deep it is.
+If enabled, group messages are listed from their denormalized inbox (@see :class:`messenger.models.GroupMessageInbox`).
+
+Many (or all) messages are marked as read at once with ``mark_as_read(...)``, which changes the unread messages counter
+only once and sends only one notification update.
+
+Every inbox has a version (@see ``get_inbox_version(...)``), that is bumped with every notification update of its user.
+Clients polling the message overview revalidate their page with it, an unchanged inbox is never queried again.
+
+Configuration example::
+
+    MESSENGER_INBOX = {
+        'PAGE_SIZE': 50,            # Maximum number of messages per page
+        'VERSION_CACHE': 'default', # Alias of the cache, that holds the inbox versions
+    }
+"""
+__all__ = (
+    'MessageMetaData', 'InboxPage', 'get_inbox_page', 'aget_inbox_page', 'encode_cursor', 'decode_cursor', 'mark_as_read',
+    'amark_as_read', 'InboxVersion', 'get_inbox_version', 'aget_inbox_version', 'set_inbox_versions',
+)
+
+import json
+from base64 import urlsafe_b64decode, urlsafe_b64encode
+from binascii import Error as Base64Error
+from dataclasses import dataclass
+from datetime import datetime
+from typing import Any, Iterable, Mapping, NamedTuple, Optional
+
+from asgiref.sync import sync_to_async
+from django.conf import settings
+from django.core.cache import caches, BaseCache
+from django.core.exceptions import BadRequest
+from django.db import transaction
+from django.db.models import Exists, F, OuterRef, Q, QuerySet, Value, IntegerField
+from django.db.models.signals import m2m_changed
+
+from messenger.constants import MessageType
+from messenger.models import (
+    ChannelUser, UserTextMessage, GroupTextMessage, GroupMessageInbox, Notification, read_group_inbox, chunked
+)
+
+# Position of a message within the inbox: (created, message type identifier, id)
+Cursor = tuple[datetime, int, int]
+# Selected columns of every message type, the ordering of the union refers to their names
+COLUMNS = ('created', 'message_type_id', 'id', 'title', 'read')
+
+
+def _get_configuration() -> dict[str, Any]:
+    return {
+        'PAGE_SIZE': 50,
+        'VERSION_CACHE': 'default',
+    } | getattr(settings, 'MESSENGER_INBOX', {})
+
+
+@dataclass
+class MessageMetaData:
+    message_type: MessageType
+    id: int
+    created: datetime
+    title: str
+    received: bool
+
+
+@dataclass
+class InboxPage:
+    messages: list[MessageMetaData]
+    # Cursor of the next page, or "None" if this is the last page
+    next_cursor: Optional[str]
+
+
+def encode_cursor(cursor: Cursor) -> str:
+    """
+    :param cursor: Position of the last message of a page
+    :return: URL-safe cursor
+    """
+    created, message_type, identifier = cursor
+    return urlsafe_b64encode(json.dumps((created.isoformat(), message_type, identifier)).encode()).decode()
+
+
+def decode_cursor(value: str) -> Cursor:
+    """
+    :param value: URL-safe cursor (@see ``encode_cursor(...)``)
+    :return: Position of the last message of the previous page
+    :raise BadRequest: If the cursor is invalid
+    """
+    try:
+        created, message_type, identifier = json.loads(urlsafe_b64decode(value.encode()))
+        return datetime.fromisoformat(created), int(message_type), int(identifier)
+    except (Base64Error, UnicodeError, ValueError, TypeError) as exc:
+        raise BadRequest(f'Invalid inbox cursor "{value}"') from exc
+
+
+def _after(queryset: QuerySet, message_type: MessageType, cursor: Optional[Cursor], id_field: str = 'id') -> QuerySet:
+    """
+    Keyset condition for one part of the union, the message type is constant within each part.
+    """
+    if cursor is None:
+        return queryset
+    created, cursor_type, identifier = cursor
+    if int(message_type) > cursor_type:
+        return queryset.filter(created__gte=created)
+    if int(message_type) < cursor_type:
+        return queryset.filter(created__gt=created)
+    return queryset.filter(Q(created__gt=created) | Q(created=created, **{f'{id_field}__gt': identifier}))
+
+
+def _group_messages(user_pk: int, position: Optional[Cursor]) -> QuerySet:
+    message_type_id = Value(int(MessageType.GROUP_TEXT_MESSAGE), output_field=IntegerField())
+    if read_group_inbox():
+        # @see messenger.models.GroupMessageInbox
+        inbox = _after(GroupMessageInbox.objects.filter(user_id=user_pk), MessageType.GROUP_TEXT_MESSAGE, position, 'message_id')
+        # NOTE: Annotated (like in all other parts of the union), since Django selects fields before annotations
+        inbox = inbox.annotate(message_type_id=message_type_id, read_state=F('read'))
+        return inbox.values_list('created', 'message_type_id', 'message_id', 'message__title', 'read_state')
+    # @see messenger.models.AbstractGroupMessage.received_group
+    received = GroupTextMessage.received_group.through.objects.filter(grouptextmessage_id=OuterRef('pk'), channeluser_id=user_pk)
+    group_messages = _after(GroupTextMessage.objects.filter(target_group__pk=user_pk), MessageType.GROUP_TEXT_MESSAGE, position)
+    return group_messages.annotate(message_type_id=message_type_id, read=Exists(received)).values_list(*COLUMNS)
+
+
+def get_inbox_page(user_pk: int, cursor: Optional[str] = None, page_size: Optional[int] = None) -> InboxPage:
+    """
+    Loads one page of the inbox of the given user (oldest messages first) with a single query.
+
+    :param user_pk: Primary key of the user
+    :param cursor: Cursor of the page (@see ``InboxPage.next_cursor``), defaults to the first page
+    :param page_size: Maximum number of messages per page, defaults to the ``PAGE_SIZE`` of the ``MESSENGER_INBOX`` setting
+    :return: Page of the inbox
+    :raise BadRequest: If the cursor is invalid
+    """
+    page_size = page_size or _get_configuration()['PAGE_SIZE']
+    return _to_page(list(_inbox(user_pk, cursor, page_size)), page_size)
+
+
+async def aget_inbox_page(user_pk: int, cursor: Optional[str] = None, page_size: Optional[int] = None) -> InboxPage:
+    """
+    Asynchronous variant of ``get_inbox_page(...)``
+
+    :param user_pk: Primary key of the user
+    :param cursor: Cursor of the page (@see ``InboxPage.next_cursor``), defaults to the first page
+    :param page_size: Maximum number of messages per page, defaults to the ``PAGE_SIZE`` of the ``MESSENGER_INBOX`` setting
+    :return: Page of the inbox
+    :raise BadRequest: If the cursor is invalid
+    """
+    page_size = page_size or _get_configuration()['PAGE_SIZE']
+    return _to_page([row async for row in _inbox(user_pk, cursor, page_size)], page_size)
+
+
+def _inbox(user_pk: int, cursor: Optional[str], page_size: int) -> QuerySet:
+    position = None if cursor is None else decode_cursor(cursor)
+    user_messages = _after(UserTextMessage.objects.filter(user_id=user_pk), MessageType.USER_TEXT_MESSAGE, position).annotate(
+        message_type_id=Value(int(MessageType.USER_TEXT_MESSAGE), output_field=IntegerField()),
+        read=F('received'),
+    ).values_list(*COLUMNS)
+    group_messages = _group_messages(user_pk, position)
+    # NOTE: One more row than needed, to find out if there is a next page
+    return user_messages.union(group_messages, all=True).order_by('created', 'message_type_id', 'id')[:page_size + 1]
+
+
+def _to_page(rows: list[tuple], page_size: int) -> InboxPage:
+    messages = [
+        MessageMetaData(MessageType(message_type), identifier, created, title, bool(read))
+        for created, message_type, identifier, title, read in rows[:page_size]
+    ]
+    next_cursor = None
+    if len(rows) > page_size:
+        last = messages[-1]
+        next_cursor = encode_cursor((last.created, int(last.message_type), last.id))
+    return InboxPage(messages, next_cursor)
+
+
+def mark_as_read(user: ChannelUser, user_message_pks: Optional[Iterable[int]] = None, group_message_pks: Optional[Iterable[int]] = None) -> int:
+    """
+    Marks the given messages of the given user as read. User messages are flipped with one UPDATE, all missing
+    "received_group" rows are inserted at once, and the unread messages counter is decremented only once, by the exact
+    number of messages that were actually unread. Hence, the user gets only one notification update.
+
+    :param user: User who has read the messages
+    :param user_message_pks: Primary keys of user messages, "None" marks all user messages of this user as read
+    :param group_message_pks: Primary keys of group messages, "None" marks all group messages of this user as read
+    :return: Number of messages, that were unread before
+    """
+    user_messages = UserTextMessage.objects.filter(user=user, received=False)
+    # @see messenger.models.AbstractGroupMessage.received_group
+    group_messages = GroupTextMessage.objects.filter(target_group__pk=user.pk).exclude(received_group__pk=user.pk)
+    with transaction.atomic():
+        # NOTE: Locks the counter of this user, so concurrent calls never count the same message twice
+        list(Notification.objects.select_for_update().filter(user=user).values_list('pk', flat=True))
+        if user_message_pks is None:
+            read_user_messages = user_messages.update(received=True)
+        else:
+            read_user_messages = sum(user_messages.filter(pk__in=chunk).update(received=True) for chunk in chunked(user_message_pks))
+        if group_message_pks is None:
+            unread_group_message_pks = list(group_messages.values_list('pk', flat=True))
+        else:
+            unread_group_message_pks = [
+                pk for chunk in chunked(group_message_pks) for pk in group_messages.filter(pk__in=chunk).values_list('pk', flat=True)
+            ]
+        through = GroupTextMessage.received_group.through
+        through.objects.bulk_create(
+            (through(grouptextmessage_id=message_pk, channeluser_id=user.pk) for message_pk in unread_group_message_pks),
+            ignore_conflicts=True,
+        )
+        if unread_group_message_pks:
+            # NOTE: Bulk inserts of through rows send no signal, but receivers (e.g. the group message inbox) rely on it
+            m2m_changed.send(
+                sender=through, instance=user, action='post_add', reverse=True, model=GroupTextMessage,
+                pk_set=set(unread_group_message_pks), using=through.objects.db,
+            )
+        read_messages = read_user_messages + len(unread_group_message_pks)
+        Notification.decrement_unread_messages({user.pk: read_messages})
+    return read_messages
+
+
+async def amark_as_read(user: ChannelUser, user_message_pks: Optional[Iterable[int]] = None, group_message_pks: Optional[Iterable[int]] = None) -> int:
+    """
+    Asynchronous variant of ``mark_as_read(...)``
+    """
+    # NOTE: Transactions are not supported in asynchronous contexts yet
+    return await sync_to_async(mark_as_read)(user, user_message_pks, group_message_pks)
+
+
+class InboxVersion(NamedTuple):
+    version: int
+    modified: datetime
+
+
+def _get_version_cache() -> BaseCache:
+    return caches[_get_configuration()['VERSION_CACHE']]
+
+
+def _get_version_key(user_pk: int) -> str:
+    return f'messenger:inbox-version:{user_pk}'
+
+
+def get_inbox_version(user_pk: int) -> InboxVersion:
+    """
+    Returns the current version of the inbox of the given user. Only on a cache miss the version is read from the database.
+
+    NOTE: Versions are written through to the cache after every committed change (@see ``set_inbox_versions(...)``).
+          With more than one worker process, the cache must be shared by all of them (e.g. Redis, not local memory).
+
+    :param user_pk: Primary key of the user
+    :return: Version of the inbox
+    """
+    cache = _get_version_cache()
+    version: Optional[InboxVersion] = cache.get(_get_version_key(user_pk))
+    if version is None:
+        version = InboxVersion(*Notification.objects.values_list('inbox_version', 'inbox_modified').get(user_id=user_pk))
+        # NOTE: Never overwrites a version, that was written through concurrently with a (newer) committed value
+        cache.add(_get_version_key(user_pk), tuple(version))
+    return InboxVersion(*version)
+
+
+async def aget_inbox_version(user_pk: int) -> InboxVersion:
+    """
+    Asynchronous variant of ``get_inbox_version(...)``
+    """
+    cache = _get_version_cache()
+    version: Optional[InboxVersion] = await cache.aget(_get_version_key(user_pk))
+    if version is None:
+        version = InboxVersion(*await Notification.objects.values_list('inbox_version', 'inbox_modified').aget(user_id=user_pk))
+        await cache.aadd(_get_version_key(user_pk), tuple(version))
+    return InboxVersion(*version)
+
+
+def set_inbox_versions(versions: Mapping[int, InboxVersion]) -> None:
+    """
+    Writes the given (committed) versions through to the cache.
+
+    NOTE: Cached versions expire after the default timeout of the cache, so a version, that was overwritten by an older
+          one (concurrent commits), is read from the database again at the latest after this timeout.
+
+    :param versions: Primary keys of users mapping to the version of their inbox
+    """
+    if versions:
+        _get_version_cache().set_many({_get_version_key(user_pk): tuple(version) for user_pk, version in versions.items()})
+
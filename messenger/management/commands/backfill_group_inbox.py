@@ -0,0 +1,42 @@
+from datetime import datetime
+
+from django.core.management.base import BaseCommand
+
+from messenger.models import GroupTextMessage, GroupMessageInbox
+
+
+class Command(BaseCommand):
+    help = (
+        'Copies all recipients & read states of existing group messages into their inboxes (@see GroupMessageInbox). '
+        'Run this after enabling the "MESSENGER_GROUP_INBOX" setting and before switching the read paths over.'
+    )
+
+    def add_arguments(self, parser) -> None:
+        parser.add_argument('--chunk-size', type=int, default=500, help='Number of group messages copied at once')
+
+    def handle(self, *args, chunk_size: int, **options) -> None:
+        target_through = GroupTextMessage.target_group.through
+        received_through = GroupTextMessage.received_group.through
+        copied = last_message_pk = 0
+        while True:
+            # NOTE: Keyset pagination, the chunks stay cheap no matter how many messages were copied already
+            created: dict[int, datetime] = dict(
+                GroupTextMessage.objects.filter(pk__gt=last_message_pk).order_by('pk').values_list('pk', 'created')[:chunk_size]
+            )
+            if not created:
+                break
+            received: set[tuple[int, int]] = set(
+                received_through.objects.filter(grouptextmessage_id__in=created).values_list('grouptextmessage_id', 'channeluser_id')
+            )
+            entries = [
+                GroupMessageInbox(message_id=message_pk, user_id=user_pk, read=(message_pk, user_pk) in received, created=created[message_pk])
+                for message_pk, user_pk in target_through.objects.filter(grouptextmessage_id__in=created).values_list('grouptextmessage_id', 'channeluser_id')
+            ]
+            # NOTE: Entries that already exist (e.g. written via Signals meanwhile) get their read state updated
+            GroupMessageInbox.objects.bulk_create(
+                entries, update_conflicts=True, unique_fields=('message', 'user'), update_fields=('read', )
+            )
+            copied += len(entries)
+            last_message_pk = max(created)
+            self.stdout.write(f'{copied} inbox entries copied (up to group message {last_message_pk})')
+        self.stdout.write(self.style.SUCCESS(f'Backfilled {copied} inbox entries'))
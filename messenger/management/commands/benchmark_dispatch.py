@@ -0,0 +1,38 @@
+from timeit import Timer
+
+from django.core.management.base import BaseCommand
+
+from messenger.constants import MessageType, MESSAGE_TYPE_KEYWORD
+from messenger.consumers import MessengerConsumerDevelopment
+
+
+def _linear_scan(identifier: int) -> MessageType:
+    """ Former resolution of ``MessageType.get_message_type(...)``, kept as baseline for comparison """
+    for m_type in MessageType:
+        if m_type.value == identifier:
+            return m_type
+    raise ValueError(f'Unknown message type: {identifier}')
+
+
+class Command(BaseCommand):
+    help = 'Measures the cost per received frame to resolve the handler of a message type'
+
+    def add_arguments(self, parser) -> None:
+        parser.add_argument('--frames', type=int, default=1_000_000, help='Number of frames per measurement')
+        parser.add_argument('--repeat', type=int, default=5, help='Number of measurements (the best one is reported)')
+
+    def handle(self, *args, frames: int, repeat: int, **options) -> None:
+        handlers = MessengerConsumerDevelopment.message_handlers
+        self.stdout.write(f'{"Message type":<20}{"Linear scan":>16}{"Registry":>16}')
+        for message_type in MessageType:
+            content = {MESSAGE_TYPE_KEYWORD: int(message_type)}
+            baseline = self._measure(lambda: _linear_scan(content[MESSAGE_TYPE_KEYWORD]), frames, repeat)
+            registry = self._measure(lambda: handlers.get(content.get(MESSAGE_TYPE_KEYWORD)), frames, repeat)
+            self.stdout.write(f'{message_type.name:<20}{baseline:>13.1f} ns{registry:>13.1f} ns')
+
+    @staticmethod
+    def _measure(statement, frames: int, repeat: int) -> float:
+        """
+        :return: Best measured duration per frame in nanoseconds
+        """
+        return min(Timer(statement).repeat(repeat=repeat, number=frames)) / frames * 1e9
@@ -0,0 +1,84 @@
+from dataclasses import dataclass
+from timeit import Timer
+from typing import Any, Self
+
+from django.core.management.base import BaseCommand
+
+from messenger.constants import MESSAGE_TYPE_KEYWORD, MessageType
+from messenger.dto import ErrorDTO, NotificationDTO
+
+
+# Former handwritten DTOs, kept as baseline for comparison with the generated functions (@see messenger.dto)
+
+@dataclass(slots=True, frozen=True, init=False)
+class HandwrittenErrorDTO:
+    MESSAGE_TYPE = MessageType.ERROR
+    error_code: int
+    error_message: str
+
+    def __init__(self, error_code: int, error_message: str) -> None:
+        object.__setattr__(self, 'error_code', error_code)
+        object.__setattr__(self, 'error_message', error_message)
+
+    @classmethod
+    def deserialize(cls, data: dict[str, Any]) -> Self:
+        return cls(data['errorCode'], data['errorMessage'])
+
+    def serialize(self) -> dict[str, Any]:
+        return {
+            MESSAGE_TYPE_KEYWORD: int(self.MESSAGE_TYPE),
+            'errorCode': self.error_code,
+            'errorMessage': self.error_message,
+        }
+
+
+@dataclass(slots=True, frozen=True, init=False)
+class HandwrittenNotificationDTO:
+    MESSAGE_TYPE = MessageType.NOTIFICATION
+    unread_messages: int
+
+    def __init__(self, unread_messages: int) -> None:
+        object.__setattr__(self, 'unread_messages', unread_messages)
+
+    @classmethod
+    def deserialize(cls, data: dict[str, Any]) -> Self:
+        return cls(data['unreadMessages'])
+
+    def serialize(self) -> dict[str, Any]:
+        return {
+            MESSAGE_TYPE_KEYWORD: int(self.MESSAGE_TYPE),
+            'unreadMessages': self.unread_messages
+        }
+
+
+class Command(BaseCommand):
+    help = 'Compares the generated DTO functions with the former handwritten ones'
+
+    def add_arguments(self, parser) -> None:
+        parser.add_argument('--number', type=int, default=1_000_000, help='Number of calls per measurement')
+        parser.add_argument('--repeat', type=int, default=5, help='Number of measurements (the best one is reported)')
+
+    def handle(self, *args, number: int, repeat: int, **options) -> None:
+        self.stdout.write(f'{"Operation":<36}{"Handwritten":>16}{"Generated":>16}{"Speedup":>10}')
+        for name, handwritten_class, generated_class, arguments in (
+            ('ErrorDTO', HandwrittenErrorDTO, ErrorDTO, (404, 'Not found')),
+            ('NotificationDTO', HandwrittenNotificationDTO, NotificationDTO, (42, )),
+        ):
+            handwritten = handwritten_class(*arguments)
+            generated = generated_class(*arguments)
+            data = generated.serialize()
+            for operation, handwritten_statement, generated_statement in (
+                ('construct', lambda: handwritten_class(*arguments), lambda: generated_class(*arguments)),
+                ('serialize', handwritten.serialize, generated.serialize),
+                ('deserialize', lambda: handwritten_class.deserialize(data), lambda: generated_class.deserialize(data)),
+            ):
+                baseline = self._measure(handwritten_statement, number, repeat)
+                result = self._measure(generated_statement, number, repeat)
+                self.stdout.write(f'{f"{name}.{operation}":<36}{baseline:>13.1f} ns{result:>13.1f} ns{baseline / result:>9.2f}x')
+
+    @staticmethod
+    def _measure(statement, number: int, repeat: int) -> float:
+        """
+        :return: Best measured duration per call in nanoseconds
+        """
+        return min(Timer(statement).repeat(repeat=repeat, number=number)) / number * 1e9
@@ -0,0 +1,96 @@
+import asyncio
+from importlib import import_module
+from statistics import quantiles
+from time import perf_counter
+from types import ModuleType
+from uuid import uuid4
+
+from django.conf import settings
+from django.core.management.base import BaseCommand, CommandError
+from django.test import AsyncClient, override_settings
+from django.urls import include, path, reverse
+
+from messenger.models import ChannelUser, GroupTextMessage, Notification, UserTextMessage
+from messenger.urls import get_urlpatterns
+
+
+def _get_urlconf(asynchronous: bool) -> ModuleType:
+    """
+    :return: Copy of the root URLconf, that serves the messenger by the given variant of views
+    """
+    urlconf = ModuleType(f'benchmark_urls_{"async" if asynchronous else "sync"}')
+    urlconf.urlpatterns = [
+        path('', include(get_urlpatterns(asynchronous))) if getattr(pattern, 'urlconf_name', None) == 'messenger.urls' else pattern
+        for pattern in import_module(settings.ROOT_URLCONF).urlpatterns
+    ]
+    return urlconf
+
+
+class Command(BaseCommand):
+    help = (
+        'Requests the message views of a (temporary) user concurrently through the ASGI handler, once served by the '
+        'synchronous & once by the asynchronous views (@see MESSENGER_VIEWS), and compares throughput & latencies'
+    )
+
+    def add_arguments(self, parser) -> None:
+        parser.add_argument('--requests', type=int, default=500, help='Number of requests per view & variant')
+        parser.add_argument('--concurrency', type=int, default=50, help='Number of concurrent requests')
+        parser.add_argument('--messages', type=int, default=100, help='Number of user & of group messages of the user')
+
+    def handle(self, *args, requests: int, concurrency: int, messages: int, **options) -> None:
+        if messages < 1:
+            raise CommandError('The user needs at least one message of each type')
+        user = ChannelUser.objects.create(username=f'benchmark-{uuid4().hex}')
+        group_messages = [GroupTextMessage.objects.create(title='Title', content='Content') for _ in range(messages)]
+        try:
+            UserTextMessage.objects.bulk_create(UserTextMessage(user=user, title='Title', content='Content') for _ in range(messages))
+            user_message_pks = list(UserTextMessage.objects.filter(user=user).values_list('pk', flat=True))
+            for group_message in group_messages:
+                group_message.target_group.add(user)
+            self.stdout.write(f'{"View":<20}{"Variant":<10}{"Requests/s":>12}{"p50":>12}{"p95":>12}{"p99":>12}')
+            for name, identifiers in (('message-overview', (None, )), ('user-message', user_message_pks), ('group-message', [message.pk for message in group_messages])):
+                for asynchronous in (False, True):
+                    # NOTE: Both variants start with all messages unread, so they perform the same writes
+                    self._mark_as_unread(user, len(user_message_pks) + len(group_messages))
+                    with override_settings(ROOT_URLCONF=_get_urlconf(asynchronous), ALLOWED_HOSTS=[*settings.ALLOWED_HOSTS, 'testserver']):
+                        urls = [reverse(name, args=() if identifier is None else (identifier, )) for identifier in identifiers]
+                        duration, latencies = asyncio.run(self._load(user, urls, requests, concurrency))
+                    p50, p95, p99 = (quantiles(latencies, n=100)[index] * 1000 for index in (49, 94, 98))
+                    self.stdout.write(
+                        f'{name:<20}{"async" if asynchronous else "sync":<10}{requests / duration:>12.1f}'
+                        f'{p50:>9.1f} ms{p95:>9.1f} ms{p99:>9.1f} ms'
+                    )
+        finally:
+            # NOTE: Messages first, their receivers decrement the counter of the user, which is deleted along with him
+            UserTextMessage.objects.filter(user=user).delete()
+            user.delete()
+            GroupTextMessage.objects.filter(pk__in=[message.pk for message in group_messages]).delete()
+
+    @staticmethod
+    def _mark_as_unread(user: ChannelUser, unread_messages: int) -> None:
+        UserTextMessage.objects.filter(user=user).update(received=False)
+        GroupTextMessage.received_group.through.objects.filter(channeluser_id=user.pk).delete()
+        Notification.objects.filter(user=user).update(unread_messages=unread_messages)
+
+    @staticmethod
+    async def _load(user: ChannelUser, urls: list[str], requests: int, concurrency: int) -> tuple[float, list[float]]:
+        """
+        :return: Total duration & latency of every request in seconds
+        """
+        client = AsyncClient()
+        await client.aforce_login(user)
+        latencies: list[float] = []
+        pending = iter(range(requests))
+
+        async def worker() -> None:
+            # NOTE: All workers share the same iterator, so exactly the given number of requests is sent
+            for index in pending:
+                start = perf_counter()
+                response = await client.get(urls[index % len(urls)])
+                latencies.append(perf_counter() - start)
+                if response.status_code != 200:
+                    raise CommandError(f'GET {urls[index % len(urls)]} failed with status {response.status_code}')
+
+        start = perf_counter()
+        await asyncio.gather(*(worker() for _ in range(concurrency)))
+        return perf_counter() - start, latencies
@@ -0,0 +1,53 @@
+from time import sleep
+
+from django.core.management.base import BaseCommand
+
+from messenger.counters import get_counter_cache
+from messenger.models import Notification
+
+
+class Command(BaseCommand):
+    help = (
+        'Compares the cached & stored unread messages counters with the actual number of unread messages '
+        '(@see Notification.reset_notifications) and repairs every drifted counter'
+    )
+
+    def add_arguments(self, parser) -> None:
+        parser.add_argument('--chunk-size', type=int, default=1000, help='Number of users checked at once')
+        parser.add_argument('--interval', type=float, default=0, help='Repeat every INTERVAL seconds (0 runs only once)')
+
+    def handle(self, *args, chunk_size: int, interval: float, **options) -> None:
+        while True:
+            checked, repaired_db, repaired_cache = self.reconcile(chunk_size)
+            self.stdout.write(
+                f'Checked {checked} counters, repaired {repaired_db} in the database and {repaired_cache} in the cache'
+            )
+            if interval <= 0:
+                return
+            sleep(interval)
+
+    @staticmethod
+    def reconcile(chunk_size: int) -> tuple[int, int, int]:
+        """
+        :return: Number of checked counters, of repaired counters in the database & of repaired counters in the cache
+        """
+        cache = get_counter_cache()
+        checked = repaired_db = repaired_cache = 0
+        last_user_pk = 0
+        while True:
+            # NOTE: Keyset pagination, the chunks stay cheap no matter how many users were checked already
+            user_pks: list[int] = list(
+                Notification.objects.filter(user_id__gt=last_user_pk).order_by('user_id').values_list('user_id', flat=True)[:chunk_size]
+            )
+            if not user_pks:
+                return checked, repaired_db, repaired_cache
+            # NOTE: Repaired counters are pushed to their users and written through to the cache
+            actual, drifted = Notification.reconcile_unread_messages(user_pks)
+            cached = cache.get_many(actual)
+            # NOTE: Removed instead of overwritten, the version of the repaired counter is unknown here
+            stale = [user_pk for user_pk, unread_messages in actual.items() if cached[user_pk] not in (None, unread_messages)]
+            cache.delete_many(stale)
+            checked += len(actual)
+            repaired_db += len(drifted)
+            repaired_cache += len(stale)
+            last_user_pk = user_pks[-1]
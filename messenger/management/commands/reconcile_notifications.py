@@ -0,0 +1,60 @@
+import os
+from concurrent.futures import ProcessPoolExecutor, as_completed
+from typing import Iterator
+
+import django
+from django.core.management.base import BaseCommand
+from django.db import connections, router
+
+from messenger.models import Notification
+
+
+def _initialize_worker() -> None:
+    # NOTE: Required for the "spawn" start method (e.g. macOS & Windows), a no-op for already set up (forked) processes
+    django.setup()
+
+
+def _reconcile_chunk(user_pks: list[int]) -> tuple[int, int]:
+    """
+    :return: Number of checked & of drifted counters
+    """
+    actual, drifted = Notification.reconcile_unread_messages(user_pks)
+    return len(actual), len(drifted)
+
+
+class Command(BaseCommand):
+    help = (
+        'Recounts the unread messages of all users (@see Notification.reset_notifications) in parallel '
+        'and repairs every drifted notification counter'
+    )
+
+    def add_arguments(self, parser) -> None:
+        parser.add_argument('--chunk-size', type=int, default=5000, help='Number of users recounted at once')
+        parser.add_argument('--processes', type=int, default=os.cpu_count(), help='Number of worker processes')
+
+    def handle(self, *args, chunk_size: int, processes: int, **options) -> None:
+        user_pks: list[int] = list(Notification.objects.order_by('user_id').values_list('user_id', flat=True))
+        chunks = [user_pks[index:index + chunk_size] for index in range(0, len(user_pks), chunk_size)]
+        if connections[router.db_for_write(Notification)].vendor == 'sqlite':
+            # NOTE: SQLite allows only one writer at a time, concurrent processes would just fail with "database is locked"
+            processes = 1
+        checked = drifted = 0
+        for chunk_checked, chunk_drifted in self._reconcile(chunks, processes):
+            checked += chunk_checked
+            drifted += chunk_drifted
+            self.stdout.write(f'{checked}/{len(user_pks)} counters checked, {drifted} drifted')
+        self.stdout.write(self.style.SUCCESS(f'Repaired {drifted} of {checked} notification counters'))
+
+    @staticmethod
+    def _reconcile(chunks: list[list[int]], processes: int) -> Iterator[tuple[int, int]]:
+        """
+        :return: Number of checked & of drifted counters per chunk, in order of completion
+        """
+        if processes <= 1:
+            yield from map(_reconcile_chunk, chunks)
+            return
+        # NOTE: Forked worker processes must not share the DB connections of this process, they open their own
+        connections.close_all()
+        with ProcessPoolExecutor(max_workers=processes, initializer=_initialize_worker) as executor:
+            for future in as_completed([executor.submit(_reconcile_chunk, chunk) for chunk in chunks]):
+                yield future.result()
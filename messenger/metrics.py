@@ -0,0 +1,154 @@
+"""
+Minimal, dependency free instrumentation for this application.
+
+Every worker process holds its own registry of metrics. The registry can be rendered in the
+Prometheus text exposition format, so each worker can be scraped individually (@see ``messenger.views.MetricsView``).
+Quantiles (e.g. p50/p99) are computed on the Prometheus side from the histogram buckets.
+
+@see `Prometheus DOCs - Exposition formats <https://prometheus.io/docs/instrumenting/exposition_formats/>`__
+"""
+__all__ = ('Counter', 'Histogram', 'Registry', 'REGISTRY', 'CONSUMER_PHASE_SECONDS', 'timed')
+
+from bisect import bisect_left
+from contextlib import contextmanager
+from threading import Lock
+from time import perf_counter
+from typing import Iterator, TypeVar
+
+# Default latency buckets in seconds (from 0.5ms up to 10s)
+DEFAULT_BUCKETS: tuple[float, ...] = (
+    0.0005, 0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0
+)
+
+
+def _format_labels(label_names: tuple[str, ...], label_values: tuple[str, ...], extra: str = '') -> str:
+    pairs = [f'{name}="{value}"' for name, value in zip(label_names, label_values)]
+    if extra:
+        pairs.append(extra)
+    return '{' + ','.join(pairs) + '}' if pairs else ''
+
+
+def _format_value(value: float) -> str:
+    if value == float('inf'):
+        return '+Inf'
+    return repr(float(value)) if isinstance(value, float) else str(value)
+
+
+class Counter:
+    """ Monotonically increasing counter, optionally partitioned by labels """
+
+    def __init__(self, name: str, documentation: str, label_names: tuple[str, ...] = ()) -> None:
+        self.name = name
+        self.documentation = documentation
+        self.label_names = label_names
+        self._values: dict[tuple[str, ...], float] = {}
+        self._lock = Lock()
+
+    def inc(self, amount: float = 1, **labels: str) -> None:
+        key = tuple(str(labels[name]) for name in self.label_names)
+        with self._lock:
+            self._values[key] = self._values.get(key, 0) + amount
+
+    def get(self, **labels: str) -> float:
+        key = tuple(str(labels[name]) for name in self.label_names)
+        return self._values.get(key, 0)
+
+    def render(self) -> list[str]:
+        lines = [f'# HELP {self.name} {self.documentation}', f'# TYPE {self.name} counter']
+        with self._lock:
+            items = sorted(self._values.items())
+        for key, value in items:
+            lines.append(f'{self.name}{_format_labels(self.label_names, key)} {_format_value(value)}')
+        return lines
+
+
+class Histogram:
+    """ Cumulative histogram with fixed upper bounds, optionally partitioned by labels """
+
+    def __init__(self, name: str, documentation: str, label_names: tuple[str, ...] = (), buckets: tuple[float, ...] = DEFAULT_BUCKETS) -> None:
+        self.name = name
+        self.documentation = documentation
+        self.label_names = label_names
+        self.buckets = tuple(sorted(buckets))
+        # Per label set: [bucket counts (non cumulative, last one is +Inf), sum]
+        self._values: dict[tuple[str, ...], tuple[list[int], list[float]]] = {}
+        self._lock = Lock()
+
+    def observe(self, value: float, **labels: str) -> None:
+        key = tuple(str(labels[name]) for name in self.label_names)
+        index = bisect_left(self.buckets, value)
+        with self._lock:
+            counts, total = self._values.setdefault(key, ([0] * (len(self.buckets) + 1), [0.0]))
+            counts[index] += 1
+            total[0] += value
+
+    def render(self) -> list[str]:
+        lines = [f'# HELP {self.name} {self.documentation}', f'# TYPE {self.name} histogram']
+        with self._lock:
+            items = sorted((key, (list(counts), total[0])) for key, (counts, total) in self._values.items())
+        for key, (counts, total) in items:
+            cumulative = 0
+            for upper_bound, count in zip((*self.buckets, float('inf')), counts):
+                cumulative += count
+                labels = _format_labels(self.label_names, key, f'le="{_format_value(upper_bound)}"')
+                lines.append(f'{self.name}_bucket{labels} {cumulative}')
+            labels = _format_labels(self.label_names, key)
+            lines.append(f'{self.name}_sum{labels} {_format_value(total)}')
+            lines.append(f'{self.name}_count{labels} {cumulative}')
+        return lines
+
+
+Metric = TypeVar('Metric', Counter, Histogram)
+
+
+class Registry:
+    """ Collection of all metrics of this worker process """
+
+    def __init__(self) -> None:
+        self._metrics: dict[str, Counter | Histogram] = {}
+
+    def register(self, metric: Metric) -> Metric:
+        if metric.name in self._metrics:
+            raise ValueError(f'Metric "{metric.name}" is already registered')
+        self._metrics[metric.name] = metric
+        return metric
+
+    def render(self) -> str:
+        """
+        Renders all registered metrics in the Prometheus text exposition format (version 0.0.4)
+
+        :return: Prometheus text
+        """
+        lines: list[str] = []
+        for metric in self._metrics.values():
+            lines.extend(metric.render())
+        return '\n'.join(lines) + '\n'
+
+
+REGISTRY = Registry()
+
+CONSUMER_PHASE_SECONDS = REGISTRY.register(Histogram(
+    'messenger_consumer_phase_seconds',
+    'Latency of the single phases of the messenger websocket consumer in seconds',
+    ('handler', 'phase'),
+))
+
+
+@contextmanager
+def timed(histogram: Histogram, **labels: str) -> Iterator[None]:
+    """
+    Measures the execution time of the wrapped block and records it into the given histogram.
+
+    Example::
+
+        with timed(CONSUMER_PHASE_SECONDS, handler='connect', phase='group_add'):
+            await self.channel_layer.group_add(...)
+
+    :param histogram: Histogram the measured duration is recorded to
+    :param labels: Label values of the histogram
+    """
+    start = perf_counter()
+    try:
+        yield
+    finally:
+        histogram.observe(perf_counter() - start, **labels)
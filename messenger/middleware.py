@@ -0,0 +1,31 @@
+"""
+ASGI middlewares of the websocket application.
+
+@see `Channels DOCs - Middleware <https://channels.readthedocs.io/en/latest/topics/authentication.html#custom-authentication>`__
+"""
+__all__ = ('TimedAuthMiddleware', 'TimedAuthMiddlewareStack')
+
+from channels.auth import AuthMiddleware
+from channels.middleware import BaseMiddleware
+from channels.sessions import CookieMiddleware, SessionMiddleware
+
+from messenger.metrics import CONSUMER_PHASE_SECONDS, timed
+
+
+class TimedAuthMiddleware(AuthMiddleware):
+    """
+    Records how long loading the user (session & user lookup) takes, as "auth" phase of the connect.
+
+    NOTE: The user is already loaded before the consumer connects, so only this middleware can measure it.
+    """
+
+    async def resolve_scope(self, scope) -> None:
+        with timed(CONSUMER_PHASE_SECONDS, handler='connect', phase='auth'):
+            await super().resolve_scope(scope)
+
+
+def TimedAuthMiddlewareStack(inner) -> BaseMiddleware:  # noqa (same naming as "AuthMiddlewareStack")
+    """
+    Drop-in replacement of ``channels.auth.AuthMiddlewareStack``, that times the authentication.
+    """
+    return CookieMiddleware(SessionMiddleware(TimedAuthMiddleware(inner)))
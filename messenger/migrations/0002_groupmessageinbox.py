@@ -0,0 +1,32 @@
+# Generated by Django 5.0.6 on 2026-10-17 22:37
+
+import django.db.models.deletion
+from django.conf import settings
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('messenger', '0001_initial'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='GroupMessageInbox',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('read', models.BooleanField(default=False)),
+                ('created', models.DateTimeField(editable=False, help_text='Date & time the message was created.')),
+                ('message', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='inbox_set', to='messenger.grouptextmessage')),
+                ('user', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='group_inbox_set', to=settings.AUTH_USER_MODEL)),
+            ],
+            options={
+                'indexes': [models.Index(fields=['user', 'read'], name='group_inbox_unread_idx'), models.Index(fields=['user', 'created', 'message'], name='group_inbox_listing_idx')],
+            },
+        ),
+        migrations.AddConstraint(
+            model_name='groupmessageinbox',
+            constraint=models.UniqueConstraint(fields=('message', 'user'), name='unique_group_message_inbox'),
+        ),
+    ]
@@ -0,0 +1,38 @@
+# Generated by Django 5.0.6 on 2026-10-17 22:39
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('messenger', '0002_groupmessageinbox'),
+    ]
+
+    operations = [
+        migrations.AddIndex(
+            model_name='usertextmessage',
+            index=models.Index(fields=['user', 'received', 'created'], name='user_message_unread_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='usertextmessage',
+            index=models.Index(fields=['user', 'created', 'id'], name='user_message_inbox_idx'),
+        ),
+        # NOTE: The auto-created through tables of "GroupTextMessage" are not part of the model state, so their
+        #       indexes are created via SQL. They are probed from the user side (e.g. "target_group__pk"), which the
+        #       default unique index (message, user) does not cover. The (user, message) order makes them covering.
+        migrations.RunSQL(
+            sql=(
+                'CREATE INDEX IF NOT EXISTS group_message_target_user_idx '
+                'ON messenger_grouptextmessage_target_group (channeluser_id, grouptextmessage_id);'
+            ),
+            reverse_sql='DROP INDEX IF EXISTS group_message_target_user_idx;',
+        ),
+        migrations.RunSQL(
+            sql=(
+                'CREATE INDEX IF NOT EXISTS group_message_received_user_idx '
+                'ON messenger_grouptextmessage_received_group (channeluser_id, grouptextmessage_id);'
+            ),
+            reverse_sql='DROP INDEX IF EXISTS group_message_received_user_idx;',
+        ),
+    ]
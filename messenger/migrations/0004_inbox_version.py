@@ -0,0 +1,24 @@
+# Generated by Django 5.0.6 on 2026-10-17 22:47
+
+import django.utils.timezone
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('messenger', '0003_access_path_indexes'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='notification',
+            name='inbox_modified',
+            field=models.DateTimeField(default=django.utils.timezone.now, editable=False, help_text='Last time the inbox of the user changed'),
+        ),
+        migrations.AddField(
+            model_name='notification',
+            name='inbox_version',
+            field=models.PositiveBigIntegerField(default=0, editable=False, help_text='Incremented whenever the inbox of the user changed'),
+        ),
+    ]
@@ -1,14 +1,47 @@
 from abc import abstractmethod
+from collections import defaultdict
+from itertools import islice
+from threading import local
+from typing import Any, Iterable, Iterator, Mapping, Optional
 
+from asgiref.sync import sync_to_async
+from django.conf import settings
 from django.contrib.auth.models import AbstractUser
+from django.db import transaction, router
 from django.db.models import (
     Model, CharField, ForeignKey, CASCADE, ManyToManyField, BooleanField, Q, DateTimeField, OneToOneField,
-    PositiveIntegerField, TextField
+    PositiveIntegerField, PositiveBigIntegerField, TextField, F, QuerySet, Expression, Case, When, Value, Count, Exists, OuterRef, Index,
+    UniqueConstraint
 )
+from django.dispatch import Signal
+from django.utils import timezone
 from django.utils.translation import gettext_lazy as _
 
 from messenger.constants import MessageType
 
+# Sent after unread messages counters were updated in the DB, without saving the models
+# Arguments: "sender" (Notification), "user_pks" (primary keys of the affected users) & "using" (DB alias)
+unread_messages_changed = Signal()
+# Sent after messages of users were changed in the DB without sending signals per message (e.g. bulk deletions)
+# Arguments: "sender" (message model), "user_pks" (primary keys of the affected users) & "using" (DB alias)
+inbox_changed = Signal()
+
+_BULK_DELETION = local()
+
+
+def chunked(values: Iterable[int], chunk_size: Optional[int] = None) -> Iterator[list[int]]:
+    """
+    Splits the given primary keys into chunks, so very large "IN (...)" clauses do not exceed the limits of the DB.
+
+    :param values: Primary keys
+    :param chunk_size: Maximum size of the chunks, defaults to "MESSENGER_FANOUT['CHUNK_SIZE']"
+    :return: Lists of at most "chunk_size" primary keys
+    """
+    iterator = iter(values)
+    chunk_size = chunk_size or getattr(settings, 'MESSENGER_FANOUT', {}).get('CHUNK_SIZE', 2000)
+    while chunk := list(islice(iterator, chunk_size)):
+        yield chunk
+
 
 class ChannelUser(AbstractUser):
 
@@ -19,7 +52,17 @@ class ChannelUser(AbstractUser):
 
         :return: Channel name
         """
-        return f'message_{self.pk}'
+        return self.get_channel_name_of(self.pk)
+
+    @staticmethod
+    def get_channel_name_of(identifier: int) -> str:
+        """
+        Same as ``get_channel_name()``, without the need to load the user from the DB.
+
+        :param identifier: Primary key of the user
+        :return: Channel name
+        """
+        return f'message_{identifier}'
 
 
 class AbstractMessageType(Model):
@@ -30,6 +73,16 @@ class AbstractMessageType(Model):
         help_text=_('Date & time this message was created.')
     )
 
+    def save(self, *args, **kwargs) -> None:
+        """
+        Saves this message along with all its signal receivers in one transaction, even in autocommit mode.
+        So the counter updates & inbox changes of this message are sent in one update after the commit
+        (@see messenger.signals.schedule_notifications), instead of one update per receiver.
+        """
+        using = kwargs.get('using') or router.db_for_write(type(self), instance=self)
+        with transaction.atomic(using=using, savepoint=False):
+            super().save(*args, **kwargs)
+
     @staticmethod
     @abstractmethod
     def get_number_of_unread_messages(user: ChannelUser) -> int:
@@ -76,10 +129,90 @@ class AbstractUserMessage(AbstractMessageType):
         self.user.notification.trigger()
 
 
+class GroupMessageQuerySet(QuerySet):
+
+    @staticmethod
+    def is_bulk_deleting() -> bool:
+        """
+        :return: If a bulk deletion (@see ``delete()``) is running in this thread, that corrects the counters on its own
+        """
+        return getattr(_BULK_DELETION, 'active', False)
+
+    def recipients(self) -> set[int]:
+        """
+        :return: Primary keys of all target users of the messages in this queryset (in one query per chunk of messages)
+        """
+        target_field = self.model.target_group.field
+        targets = self.model.target_group.through.objects.using(self._get_write_db())
+        recipients: set[int] = set()
+        # NOTE: Filtered by materialized primary keys, same as "count_unread_per_user(...)"
+        for chunk in chunked(self.values_list('pk', flat=True)):
+            recipients.update(targets.filter(**{f'{target_field.m2m_field_name()}__in': chunk}).values_list(
+                target_field.m2m_reverse_field_name(), flat=True
+            ))
+        return recipients
+
+    def count_unread_per_user(self, user_pks: Optional[Iterable[int]] = None) -> dict[int, int]:
+        """
+        Counts for every user, how many of the messages in this queryset he did not read yet
+        (in one aggregate query per chunk of messages).
+
+        :param user_pks: Only count for these users, defaults to all target users
+        :return: Primary keys of users mapping to their number of unread messages (users without unread messages are omitted)
+        """
+        target_field = self.model.target_group.field
+        received_field = self.model.received_group.field
+        received = self.model.received_group.through.objects.filter(**{
+            received_field.m2m_field_name(): OuterRef(target_field.m2m_field_name()),
+            received_field.m2m_reverse_field_name(): OuterRef(target_field.m2m_reverse_field_name()),
+        })
+        unread = self.model.target_group.through.objects.using(self._get_write_db()).exclude(Exists(received))
+        user_field = target_field.m2m_reverse_field_name()
+        if user_pks is not None:
+            unread = unread.filter(**{f'{user_field}__in': list(user_pks)})
+        if not self.query.has_filters() and not self.query.is_sliced:
+            # All messages, no need to filter the through table by message at all
+            return self._count_per_user(unread, user_field)
+        counters: dict[int, int] = defaultdict(int)
+        # NOTE: Messages are filtered by materialized primary keys instead of a subquery. With a subquery, the planner
+        #       prefers scanning the whole (user, message) index for the grouping (@see messenger.tests.QueryPlanTest).
+        for chunk in chunked(self.values_list('pk', flat=True)):
+            for user_pk, unread_messages in self._count_per_user(unread.filter(**{f'{target_field.m2m_field_name()}__in': chunk}), user_field).items():
+                counters[user_pk] += unread_messages
+        return dict(counters)
+
+    @staticmethod
+    def _count_per_user(through_rows: QuerySet, user_field: str) -> dict[int, int]:
+        return dict(through_rows.values(user_field).annotate(unread=Count('pk')).values_list(user_field, 'unread').order_by())
+
+    def delete(self) -> tuple[int, dict[str, int]]:
+        """
+        Deletes all messages of this queryset and reduces the counters of all users by their number of deleted unread
+        messages. Instead of correcting the counters per message & user (@see ``messenger.signals.never_received_group_message``),
+        the decrements are counted in one aggregate query and applied in set-based updates.
+        """
+        using = self._get_write_db()
+        with transaction.atomic(using=using):
+            decrements = self.count_unread_per_user()
+            recipients = self.recipients()
+            _BULK_DELETION.active = True
+            try:
+                result = super().delete()
+            finally:
+                _BULK_DELETION.active = False
+            Notification.decrement_unread_messages(decrements, using)
+            inbox_changed.send(sender=self.model, user_pks=recipients, using=using)
+        return result
+
+    def _get_write_db(self) -> str:
+        return self._db or router.db_for_write(self.model, **self._hints)
+
+
 class AbstractGroupMessage(AbstractMessageType):
     """
     ATTENTION: Notification trigger is handled via Signals in ``messenger.signals.trigger_group_message_notification(...)``
     """
+    objects = GroupMessageQuerySet.as_manager()
 
     # Many-to-many
     target_group = ManyToManyField(
@@ -113,12 +246,21 @@ class AbstractGroupMessage(AbstractMessageType):
         return cls.objects.filter(target_group__pk=user.pk).exclude(received_group__pk=user.pk).count()
 
     @classmethod
-    def user_received(cls, identifier: int, user: ChannelUser) -> None:
-        message: AbstractGroupMessage = cls.objects.get(pk=identifier)
-        already_received: set[int] = set(message.received_group.values_list('id', flat=True))
-        already_received.add(user.pk)
-        # message.received_group = already_received
-        message.save(update_fields=('received_group', ))
+    def user_received(cls, identifier: int, user: ChannelUser) -> bool:
+        """
+        Adds the given user to the "received_group" of the given message, without loading the message or its group.
+
+        ATTENTION: Does not change the notification counter, @see ``messenger.inbox.mark_as_read(...)``
+
+        :param identifier: Primary key of the message
+        :param user: User who received the message
+        :return: If the user did not receive this message before
+        """
+        message = cls(pk=identifier)
+        if message.received_group.filter(pk=user.pk).exists():
+            return False
+        message.received_group.add(user)
+        return True
 
     def has_read(self, user: ChannelUser) -> bool:
         """
@@ -138,6 +280,14 @@ class UserTextMessage(AbstractUserMessage):
     )
     content = TextField()
 
+    class Meta:
+        indexes = (
+            # @see get_number_of_unread_messages(...)
+            Index(fields=('user', 'received', 'created'), name='user_message_unread_idx'),
+            # @see messenger.inbox.get_inbox_page(...)
+            Index(fields=('user', 'created', 'id'), name='user_message_inbox_idx'),
+        )
+
     @staticmethod
     def message_type() -> MessageType:
         return MessageType.USER_TEXT_MESSAGE
@@ -157,15 +307,96 @@ class GroupTextMessage(AbstractGroupMessage):
     def message_type() -> MessageType:
         return MessageType.GROUP_TEXT_MESSAGE
 
+    @classmethod
+    def get_number_of_unread_messages(cls, user: ChannelUser) -> int:
+        if read_group_inbox():
+            return GroupMessageInbox.objects.filter(user=user, read=False).count()
+        return super().get_number_of_unread_messages(user)
+
+    def has_read(self, user: ChannelUser) -> bool:
+        if read_group_inbox():
+            return GroupMessageInbox.objects.filter(message=self, user=user, read=True).exists()
+        return super().has_read(user)
+
     def __str__(self) -> str:
         return self.title
 
 
+def get_group_inbox_configuration() -> dict[str, Any]:
+    return {
+        'ENABLED': False,
+        'READ': False,
+    } | getattr(settings, 'MESSENGER_GROUP_INBOX', {})
+
+
+def read_group_inbox() -> bool:
+    """
+    :return: If the read paths use the ``GroupMessageInbox`` instead of the many-to-many tables of ``GroupTextMessage``
+    """
+    configuration = get_group_inbox_configuration()
+    return configuration['ENABLED'] and configuration['READ']
+
+
+class GroupMessageInbox(Model):
+    """
+    Denormalized inbox of group messages, one row per message & recipient. Unread counts and inbox listings are simple
+    range scans over the indexes of this table, instead of anti-joins of ``target_group`` & ``received_group``.
+
+    The rows are maintained via Signals (@see ``messenger.signals.fill_group_message_inbox(...)``), while the
+    "ENABLED" flag of the ``MESSENGER_GROUP_INBOX`` setting is set. Existing messages are copied with the
+    ``backfill_group_inbox`` management command, before the read paths are switched over via the "READ" flag.
+    """
+    # Many-to-one
+    message = ForeignKey(
+        GroupTextMessage,
+        on_delete=CASCADE,  # If you delete a message, also delete it from all inboxes
+        related_name='inbox_set',
+        help_text=''
+    )
+    # Many-to-one
+    user = ForeignKey(
+        ChannelUser,
+        on_delete=CASCADE,  # If you delete a user, also delete his inbox
+        related_name='group_inbox_set',
+        help_text=''
+    )
+    read = BooleanField(
+        default=False,
+        help_text=''
+    )
+    # NOTE: Copy of "GroupTextMessage.created", so the inbox is sorted without joining the messages
+    created = DateTimeField(
+        editable=False,
+        help_text=_('Date & time the message was created.')
+    )
+
+    class Meta:
+        constraints = (
+            UniqueConstraint(fields=('message', 'user'), name='unique_group_message_inbox'),
+        )
+        indexes = (
+            Index(fields=('user', 'read'), name='group_inbox_unread_idx'),
+            Index(fields=('user', 'created', 'message'), name='group_inbox_listing_idx'),
+        )
+
+    def __str__(self) -> str:
+        return f'Inbox entry of "{self.message}" for "{self.user}"'
+
+
 class Notification(Model):
     unread_messages = PositiveIntegerField(
         default=0,
         help_text=''
     )
+    # Version of the inbox of the user, bumped with every notification update (@see messenger.inbox.get_inbox_version)
+    inbox_version = PositiveBigIntegerField(
+        default=0, editable=False,
+        help_text=_('Incremented whenever the inbox of the user changed')
+    )
+    inbox_modified = DateTimeField(
+        default=timezone.now, editable=False,
+        help_text=_('Last time the inbox of the user changed')
+    )
     # One-to-one
     user = OneToOneField(
         ChannelUser, editable=False,
@@ -187,23 +418,155 @@ class Notification(Model):
         :param user: User whose notification should be reset
         """
         unread_user_messages = UserTextMessage.objects.filter(user=user, received=False).count()
-        unread_group_messages = user.grouptextmessage_target_set.all().exclude(pk__in=(user.pk, )).count()
+        # NOTE: Group messages count as read, if the user is in their "received_group"
+        unread_group_messages = user.grouptextmessage_target_set.all().exclude(received_group__pk=user.pk).count()
         note = user.notification
         note.unread_messages = unread_user_messages + unread_group_messages
         note.save()
 
-    def trigger(self) -> None:
-        self.unread_messages += 1
-        self.save(update_fields=('unread_messages', ))
+    @classmethod
+    def reconcile_unread_messages(cls, user_pks: Iterable[int], using: Optional[str] = None) -> tuple[dict[int, int], list[int]]:
+        """
+        Same as ``reset_notifications(user)`` for many users at once: The actual numbers of unread messages are counted
+        with grouped aggregate queries, and only the drifted counters are written back (in one bulk update).
+
+        :param user_pks: Primary keys of users
+        :param using: Database alias, defaults to the DB notifications are written to
+        :return: Actual number of unread messages of all given users (that have a notification) & primary keys of all
+                 users whose counter drifted
+        """
+        using = using or router.db_for_write(cls)
+        with transaction.atomic(using=using):
+            # NOTE: Locked, so no counter changes between counting the unread messages and repairing the counter
+            stored: dict[int, tuple[int, int]] = {
+                user_pk: (pk, unread_messages) for pk, user_pk, unread_messages
+                in cls.objects.using(using).select_for_update().filter(user_id__in=list(user_pks)).values_list('pk', 'user_id', 'unread_messages')
+            }
+            actual = cls.count_unread_messages(stored)
+            drifted = [
+                cls(pk=pk, user_id=user_pk, unread_messages=actual[user_pk])
+                for user_pk, (pk, unread_messages) in stored.items() if unread_messages != actual[user_pk]
+            ]
+            cls.objects.using(using).bulk_update(drifted, ('unread_messages', ))
+        drifted_user_pks = [note.user_id for note in drifted]
+        if drifted_user_pks:
+            unread_messages_changed.send(sender=cls, user_pks=drifted_user_pks, using=using)
+        return actual, drifted_user_pks
+
+    @staticmethod
+    def count_unread_messages(user_pks: Iterable[int]) -> dict[int, int]:
+        """
+        Counts the unread messages (``UserTextMessage`` & ``GroupTextMessage``) of the given users
+        with one grouped aggregate query per message type.
+
+        :param user_pks: Primary keys of users
+        :return: Primary keys of all given users mapping to their number of unread messages
+        """
+        user_pks = list(user_pks)
+        counters: dict[int, int] = dict.fromkeys(user_pks, 0)
+        unread_user_messages = UserTextMessage.objects.filter(user_id__in=user_pks, received=False)
+        for user_pk, unread in unread_user_messages.values('user_id').annotate(unread=Count('pk')).values_list('user_id', 'unread').order_by():
+            counters[user_pk] += unread
+        for user_pk, unread in GroupTextMessage.objects.count_unread_per_user(user_pks).items():
+            counters[user_pk] += unread
+        return counters
+
+    def _update_unread_messages(self, queryset: QuerySet['Notification'], value: Expression | int) -> int:
+        """
+        Updates the counter within the DB (no read-modify-write in Python), so concurrent updates are never lost.
 
-    def read_one_message(self) -> None:
-        if self.unread_messages > 0:
-            self.unread_messages -= 1
-        self.save(update_fields=('unread_messages', ))
+        :param queryset: Filtered queryset of this notification, rows that do not match are left untouched
+        :param value: New counter, typically an expression based on the current counter
+        :return: New number of unread messages
+        """
+        using = queryset.db
+        with transaction.atomic(using=using):
+            queryset.update(unread_messages=value)
+            # NOTE: Read within the same transaction, the updated row stays locked until the commit
+            self.unread_messages = Notification.objects.using(using).values_list('unread_messages', flat=True).get(pk=self.pk)
+        # NOTE: "update()" sends no "post_save" signal
+        unread_messages_changed.send(sender=Notification, user_pks=(self.user_id, ), using=using)
+        return self.unread_messages
 
-    def clear_notifications(self) -> None:
-        self.unread_messages = 0
-        self.save(update_fields=('unread_messages', ))
+    @classmethod
+    def decrement_unread_messages(cls, decrements: Mapping[int, int], using: Optional[str] = None) -> None:
+        """
+        Atomically decrements the number of unread messages of many users, but never below 0.
+
+        NOTE: One set-based update per distinct decrement (and chunk of users), instead of one update per user.
+              Most users share the same few decrements, e.g. when deleting messages of the same groups.
+
+        :param decrements: Primary keys of users mapping to the number of messages their counter is decremented by
+        :param using: Database alias, defaults to the DB notifications are written to
+        """
+        using = using or router.db_for_write(cls)
+        users_per_decrement = cls._get_users_per_decrement(decrements)
+        if not users_per_decrement:
+            return
+        with transaction.atomic(using=using):
+            for decrement, user_pks in users_per_decrement.items():
+                for chunk in chunked(user_pks):
+                    cls.objects.using(using).filter(user_id__in=chunk).update(unread_messages=cls._decremented(decrement))
+        unread_messages_changed.send(
+            sender=cls, user_pks=[user_pk for user_pks in users_per_decrement.values() for user_pk in user_pks], using=using
+        )
+
+    @staticmethod
+    def _get_users_per_decrement(decrements: Mapping[int, int]) -> dict[int, list[int]]:
+        users_per_decrement: dict[int, list[int]] = defaultdict(list)
+        for user_pk, decrement in decrements.items():
+            if decrement > 0:
+                users_per_decrement[decrement].append(user_pk)
+        return users_per_decrement
+
+    @staticmethod
+    def _decremented(decrement: int) -> Case:
+        # NOTE: Clamped via "CASE", so no negative intermediate value is written into the (unsigned) column
+        return Case(When(unread_messages__gt=decrement, then=F('unread_messages') - decrement), default=Value(0))
+
+    def trigger(self) -> int:
+        """
+        Atomically increments the number of unread messages by 1
+
+        :return: New number of unread messages
+        """
+        return self._update_unread_messages(Notification.objects.filter(pk=self.pk), F('unread_messages') + 1)
+
+    def read_one_message(self) -> int:
+        """
+        Atomically decrements the number of unread messages by 1, but never below 0
+
+        :return: New number of unread messages
+        """
+        # NOTE: Clamped via filter, so no negative intermediate value is written into the (unsigned) column
+        return self._update_unread_messages(Notification.objects.filter(pk=self.pk, unread_messages__gt=0), F('unread_messages') - 1)
+
+    def clear_notifications(self) -> int:
+        """
+        Atomically resets the number of unread messages to 0
+
+        :return: New number of unread messages
+        """
+        return self._update_unread_messages(Notification.objects.filter(pk=self.pk), 0)
+
+    async def atrigger(self) -> int:
+        """
+        Asynchronous variant of ``trigger()``
+        """
+        # NOTE: Transactions are not supported in asynchronous contexts yet
+        return await sync_to_async(self.trigger)()
+
+    async def aread_one_message(self) -> int:
+        """
+        Asynchronous variant of ``read_one_message()``
+        """
+        return await sync_to_async(self.read_one_message)()
+
+    async def aclear_notifications(self) -> int:
+        """
+        Asynchronous variant of ``clear_notifications()``
+        """
+        return await sync_to_async(self.clear_notifications)()
 
     def __str__(self) -> str:
         return f'Notifications for "{self.user}"'
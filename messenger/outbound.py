@@ -0,0 +1,102 @@
+"""
+Per-connection outbound queue, that coalesces superseded messages before they are written to the websocket.
+
+During bulk sends a user may receive hundreds of notification updates within a few milliseconds, although only the
+latest unread counter matters. Messages of coalesced message types replace any pending message of the same type
+(latest wins). All pending messages are flushed together after a short delay.
+
+Configuration example::
+
+    MESSENGER_OUTBOUND = {
+        'FLUSH_DELAY': 0.05,    # Seconds pending messages are collected before they are sent
+    }
+"""
+__all__ = ('OutboundQueue', 'COALESCED_MESSAGE_TYPES')
+
+import asyncio
+from itertools import count
+from logging import getLogger
+from typing import Any, Awaitable, Callable, Generic, Optional, TypeVar
+
+from django.conf import settings
+
+from messenger.constants import MessageType
+from messenger.metrics import REGISTRY, Counter
+
+LOGGER = getLogger(__name__)
+
+# Message types where only the latest pending message has to be sent
+COALESCED_MESSAGE_TYPES: frozenset[MessageType] = frozenset({MessageType.NOTIFICATION})
+
+OUTBOUND_MESSAGES = REGISTRY.register(Counter(
+    'messenger_outbound_messages_total',
+    'Messages passed through the per-connection outbound queues by outcome (sent/superseded)',
+    ('outcome', ),
+))
+
+Message = TypeVar('Message')
+
+
+def _get_configuration() -> dict[str, Any]:
+    return {
+        'FLUSH_DELAY': 0.05,
+    } | getattr(settings, 'MESSENGER_OUTBOUND', {})
+
+
+class OutboundQueue(Generic[Message]):
+
+    def __init__(self, send: Callable[[Message], Awaitable[None]], flush_delay: Optional[float] = None) -> None:
+        """
+        :param send: Coroutine function that writes one message to the websocket
+        :param flush_delay: Seconds pending messages are collected before they are sent, defaults to the setting
+        """
+        self._send = send
+        self.flush_delay = _get_configuration()['FLUSH_DELAY'] if flush_delay is None else flush_delay
+        # NOTE: Dictionaries keep their insertion order, so messages are sent in the order they were pushed
+        self._pending: dict[tuple[str, int], Message] = {}
+        self._sequence = count()
+        self._flush_task: Optional[asyncio.Task] = None
+
+    def push(self, message_type: MessageType, message: Message) -> None:
+        """
+        Queues the given message. A pending message of the same (coalesced) message type is superseded.
+
+        :param message_type: Message type of the message
+        :param message: Message to send
+        """
+        # NOTE: Tagged keys, message types are integers too & would collide with the sequence numbers otherwise
+        if message_type in COALESCED_MESSAGE_TYPES:
+            key = ('coalesced', int(message_type))
+            if self._pending.pop(key, None) is not None:
+                OUTBOUND_MESSAGES.inc(outcome='superseded')
+        else:
+            key = ('sequence', next(self._sequence))
+        self._pending[key] = message
+        if self._flush_task is None:
+            self._flush_task = asyncio.create_task(self._flush_later())
+
+    async def flush(self) -> None:
+        """
+        Sends all pending messages immediately
+        """
+        pending, self._pending = self._pending, {}
+        for message in pending.values():
+            await self._send(message)
+        OUTBOUND_MESSAGES.inc(len(pending), outcome='sent')
+
+    def close(self) -> None:
+        """
+        Discards all pending messages (e.g. because the websocket is already closed)
+        """
+        if self._flush_task is not None:
+            self._flush_task.cancel()
+            self._flush_task = None
+        self._pending.clear()
+
+    async def _flush_later(self) -> None:
+        await asyncio.sleep(self.flush_delay)
+        self._flush_task = None
+        try:
+            await self.flush()
+        except Exception:  # noqa - A failing send must not break the next flush
+            LOGGER.exception('Flushing outbound queue failed')
@@ -0,0 +1,322 @@
+"""
+Registries that know which websocket channels are currently alive.
+
+Every connected consumer holds a lease in the registry. The leases of all channels of one worker process are refreshed
+together by a periodic heartbeat. If a worker dies without running ``disconnect``, its leases are not refreshed anymore,
+expire and are evicted by the heartbeat of any other worker. Evicted channels are also discarded from their channel
+layer group, so ``group_send`` stops pushing into channels no one reads anymore.
+
+Configuration example::
+
+    MESSENGER_PRESENCE = {
+        'BACKEND': 'messenger.presence.RedisPresenceRegistry',
+        'TTL': 60,                  # Seconds a lease stays valid without being refreshed
+        'HEARTBEAT_INTERVAL': 20,   # Seconds between two heartbeats of a worker process
+        'CACHE_TTL': 5,             # Seconds a lookup is cached within the worker process (0 disables the cache)
+    }
+"""
+__all__ = (
+    'PresenceCache', 'AbstractPresenceRegistry', 'InMemoryPresenceRegistry', 'RedisPresenceRegistry', 'get_presence_registry'
+)
+
+import asyncio
+import time
+from abc import ABC, abstractmethod
+from logging import getLogger
+from typing import Any, Optional
+
+from channels.layers import get_channel_layer
+from django.conf import settings
+from django.utils.module_loading import import_string
+from redis.asyncio.client import Pipeline
+
+from messenger.connections import get_redis
+from messenger.metrics import REGISTRY, Counter
+
+LOGGER = getLogger(__name__)
+
+
+def _get_configuration() -> dict[str, Any]:
+    return {
+        'BACKEND': 'messenger.presence.RedisPresenceRegistry',
+        'TTL': 60,
+        'HEARTBEAT_INTERVAL': 20,
+        'CACHE_TTL': 5,
+    } | getattr(settings, 'MESSENGER_PRESENCE', {})
+
+
+PRESENCE_CACHE_LOOKUPS = REGISTRY.register(Counter(
+    'messenger_presence_cache_lookups_total',
+    'Lookups of the per-process presence cache by result (hit/miss)',
+    ('result', ),
+))
+
+
+class PresenceCache:
+    """
+    Per-process cache of presence lookups with a short TTL, so a fan-out to many connected channels does not cause a
+    round-trip to the registry backend for every delivered message. Entries of channels registered or unregistered
+    by this worker process are updated explicitly.
+    """
+    # Expired entries are purged once the cache grows beyond this size
+    PURGE_THRESHOLD: int = 10_000
+
+    def __init__(self, ttl: float) -> None:
+        """
+        :param ttl: Seconds a cached lookup stays valid
+        """
+        self.ttl = ttl
+        # Channel names mapping to (expiry, exists)
+        self._entries: dict[str, tuple[float, bool]] = {}
+
+    def get(self, channel_name: str) -> Optional[bool]:
+        """
+        :param channel_name: Channel name to look up
+        :return: Cached presence of the channel or "None" if the lookup is not cached (anymore)
+        """
+        entry = self._entries.get(channel_name)
+        if entry is not None and entry[0] > time.monotonic():
+            PRESENCE_CACHE_LOOKUPS.inc(result='hit')
+            return entry[1]
+        PRESENCE_CACHE_LOOKUPS.inc(result='miss')
+        return None
+
+    def set(self, channel_name: str, exists: bool) -> None:
+        if self.ttl <= 0:
+            return
+        now = time.monotonic()
+        if len(self._entries) >= self.PURGE_THRESHOLD:
+            self._entries = {name: entry for name, entry in self._entries.items() if entry[0] > now}
+        self._entries[channel_name] = (now + self.ttl, exists)
+
+    def invalidate(self, channel_name: str) -> None:
+        self._entries.pop(channel_name, None)
+
+
+class AbstractPresenceRegistry(ABC):
+
+    def __init__(self, ttl: float, heartbeat_interval: float, cache_ttl: float = 0) -> None:
+        """
+        :param ttl: Seconds a lease stays valid without being refreshed
+        :param heartbeat_interval: Seconds between two heartbeats (must be smaller than the TTL)
+        :param cache_ttl: Seconds a lookup is cached within this worker process (0 disables the cache)
+        """
+        if heartbeat_interval >= ttl:
+            raise ValueError('Heartbeat interval must be smaller than the TTL of a lease')
+        self.ttl = ttl
+        self.heartbeat_interval = heartbeat_interval
+        self.cache = PresenceCache(cache_ttl)
+        # Channels of this worker process, mapping to their channel layer group
+        self._local_channels: dict[str, str] = {}
+        self._heartbeat_task: Optional[asyncio.Task] = None
+
+    @abstractmethod
+    async def _store_leases(self, leases: dict[str, str], expires_at: float) -> set[str]:
+        """
+        Creates or refreshes the leases of all given channels in one batch
+
+        :param leases: Channel names mapping to their channel layer group
+        :param expires_at: Point in time the leases expire
+        :return: Channel names, whose lease did not exist anymore & was created again
+        """
+        ...
+
+    @abstractmethod
+    async def _remove_lease(self, channel_name: str) -> None:
+        ...
+
+    @abstractmethod
+    async def _has_lease(self, channel_name: str, now: float) -> bool:
+        ...
+
+    @abstractmethod
+    async def _pop_expired_leases(self, now: float) -> dict[str, str]:
+        """
+        Removes all expired leases atomically, so a lease refreshed concurrently is never removed
+
+        :param now: Current point in time
+        :return: Evicted channel names mapping to their channel layer group
+        """
+        ...
+
+    @staticmethod
+    @abstractmethod
+    def _now() -> float:
+        ...
+
+    async def register(self, channel_name: str, group_name: str) -> None:
+        """
+        Creates a lease for the given channel, which is kept alive by the heartbeat of this worker process
+
+        :param channel_name: Channel name of the consumer
+        :param group_name: Channel layer group the channel was added to
+        """
+        self._local_channels[channel_name] = group_name
+        await self._store_leases({channel_name: group_name}, self._now() + self.ttl)
+        self.cache.set(channel_name, True)
+        self._ensure_heartbeat()
+
+    async def unregister(self, channel_name: str) -> None:
+        self._local_channels.pop(channel_name, None)
+        self.cache.invalidate(channel_name)
+        await self._remove_lease(channel_name)
+
+    async def exists(self, channel_name: str) -> bool:
+        exists = self.cache.get(channel_name)
+        if exists is None:
+            exists = await self._has_lease(channel_name, self._now())
+            self.cache.set(channel_name, exists)
+        return exists
+
+    async def heartbeat(self) -> None:
+        """
+        Refreshes the leases of all channels of this worker process and evicts all expired leases
+        """
+        now = self._now()
+        channel_layer = get_channel_layer()
+        if self._local_channels:
+            local_channels = dict(self._local_channels)
+            recreated = await self._store_leases(local_channels, now + self.ttl)
+            if recreated:
+                # NOTE: Channels of this (alive) worker process were evicted (e.g. after a stalled heartbeat), and hence
+                #       discarded from their group. Without joining again, they would never receive anything anymore.
+                LOGGER.warning(f'Recreated {len(recreated)} evicted lease(s) of this worker process')
+                if channel_layer is not None:
+                    for channel_name in recreated:
+                        await channel_layer.group_add(local_channels[channel_name], channel_name)
+        evicted = await self._pop_expired_leases(now)
+        if evicted:
+            LOGGER.warning(f'Evicted {len(evicted)} channel(s) without a valid lease')
+            for channel_name in evicted:
+                self.cache.invalidate(channel_name)
+            if channel_layer is not None:
+                for channel_name, group_name in evicted.items():
+                    await channel_layer.group_discard(group_name, channel_name)
+                    # NOTE: If the owner recreated the lease meanwhile, its "group_add" may have run before the discard
+                    if await self._has_lease(channel_name, self._now()):
+                        await channel_layer.group_add(group_name, channel_name)
+
+    def _ensure_heartbeat(self) -> None:
+        task = self._heartbeat_task
+        if task is None or task.done() or task.get_loop() is not asyncio.get_running_loop():
+            self._heartbeat_task = asyncio.create_task(self._run_heartbeat())
+
+    async def _run_heartbeat(self) -> None:
+        while True:
+            await asyncio.sleep(self.heartbeat_interval)
+            try:
+                await self.heartbeat()
+            except Exception:  # noqa - The heartbeat must survive temporary failures of the backend
+                LOGGER.exception('Presence heartbeat failed')
+
+
+class InMemoryPresenceRegistry(AbstractPresenceRegistry):
+    """
+    Presence registry for a single worker process (e.g. during development).
+    """
+
+    def __init__(self, ttl: float, heartbeat_interval: float, cache_ttl: float = 0) -> None:
+        super().__init__(ttl, heartbeat_interval, cache_ttl)
+        # Channel names mapping to (expiry, group name)
+        self._leases: dict[str, tuple[float, str]] = {}
+
+    @staticmethod
+    def _now() -> float:
+        return time.monotonic()
+
+    async def _store_leases(self, leases: dict[str, str], expires_at: float) -> set[str]:
+        recreated = {channel_name for channel_name in leases if channel_name not in self._leases}
+        for channel_name, group_name in leases.items():
+            self._leases[channel_name] = (expires_at, group_name)
+        return recreated
+
+    async def _remove_lease(self, channel_name: str) -> None:
+        self._leases.pop(channel_name, None)
+
+    async def _has_lease(self, channel_name: str, now: float) -> bool:
+        lease = self._leases.get(channel_name)
+        return lease is not None and lease[0] > now
+
+    async def _pop_expired_leases(self, now: float) -> dict[str, str]:
+        expired = {channel_name: group_name for channel_name, (expires_at, group_name) in self._leases.items() if expires_at <= now}
+        for channel_name in expired:
+            del self._leases[channel_name]
+        return expired
+
+
+class RedisPresenceRegistry(AbstractPresenceRegistry):
+    """
+    Presence registry shared by all worker processes. The leases are kept in a sorted set (scored by their expiry),
+    the channel layer groups of the leased channels in a hash.
+
+    @see :func:`messenger.connections.get_redis`
+    """
+    LEASES_KEY: str = 'messenger:presence:leases'
+    GROUPS_KEY: str = 'messenger:presence:groups'
+
+    @staticmethod
+    def _now() -> float:
+        # NOTE: Wall clock, since the leases are compared across hosts
+        return time.time()
+
+    async def _store_leases(self, leases: dict[str, str], expires_at: float) -> set[str]:
+        channel_names = list(leases)
+        # NOTE: One "ZADD" per channel (within one transaction), since only its result tells if the lease was recreated
+        async with get_redis().pipeline(transaction=True) as pipe:
+            for channel_name in channel_names:
+                pipe.zadd(self.LEASES_KEY, {channel_name: expires_at})
+            pipe.hset(self.GROUPS_KEY, mapping=leases)
+            *added, _ = await pipe.execute()
+        return {channel_name for channel_name, created in zip(channel_names, added) if created}
+
+    async def _remove_lease(self, channel_name: str) -> None:
+        async with get_redis().pipeline(transaction=False) as pipe:
+            pipe.zrem(self.LEASES_KEY, channel_name)
+            pipe.hdel(self.GROUPS_KEY, channel_name)
+            await pipe.execute()
+
+    async def _has_lease(self, channel_name: str, now: float) -> bool:
+        expires_at: Optional[float] = await get_redis().zscore(self.LEASES_KEY, channel_name)
+        return expires_at is not None and expires_at > now
+
+    async def _pop_expired_leases(self, now: float) -> dict[str, str]:
+        evicted: dict[str, str] = {}
+
+        async def pop(pipe: Pipeline) -> None:
+            # NOTE: Runs again, if any lease was refreshed (or removed) between reading & removing the expired leases
+            evicted.clear()
+            expired: list[bytes] = await pipe.zrangebyscore(self.LEASES_KEY, '-inf', now)
+            if not expired:
+                return
+            group_names: list[Optional[bytes]] = await pipe.hmget(self.GROUPS_KEY, expired)
+            pipe.multi()
+            pipe.zrem(self.LEASES_KEY, *expired)
+            pipe.hdel(self.GROUPS_KEY, *expired)
+            evicted.update(
+                (channel_name.decode(), group_name.decode())
+                for channel_name, group_name in zip(expired, group_names) if group_name is not None
+            )
+
+        # Optimistic locking: WATCH the leases, so the removal is only committed if no lease changed in between
+        await get_redis().transaction(pop, self.LEASES_KEY)
+        return evicted
+
+
+_REGISTRIES: dict[str, AbstractPresenceRegistry] = {}
+
+
+def get_presence_registry(backend: Optional[str] = None) -> AbstractPresenceRegistry:
+    """
+    Returns the presence registry of this worker process
+
+    :param backend: Dotted path of the registry class, defaults to the ``BACKEND`` of the ``MESSENGER_PRESENCE`` setting
+    :return: Presence registry
+    """
+    configuration = _get_configuration()
+    backend = backend or configuration['BACKEND']
+    registry = _REGISTRIES.get(backend)
+    if registry is None:
+        registry = _REGISTRIES[backend] = import_string(backend)(
+            configuration['TTL'], configuration['HEARTBEAT_INTERVAL'], configuration['CACHE_TTL']
+        )
+    return registry
@@ -1,35 +1,120 @@
-from typing import TypeVar
+import asyncio
+from datetime import datetime
+from functools import partial
+from threading import local
+from typing import Any, Hashable, Iterable, Optional, TypeVar
 
 from asgiref.sync import async_to_sync
 from channels.layers import get_channel_layer
+from django.conf import settings
+from django.db import transaction, DEFAULT_DB_ALIAS
+from django.db.models import F
 from django.db.models.signals import post_save, post_delete, m2m_changed, pre_delete
 from django.dispatch import receiver
+from django.utils import timezone
 
-from messenger.dto import NotificationDTO
+from messenger.codecs import JsonCodec
+from messenger.counters import VersionedCounter, get_counter_cache
+from messenger.dto import AbstractMessageDTO, NotificationDTO
+from messenger.fragments import invalidate_message
+from messenger.inbox import InboxVersion, set_inbox_versions
 from messenger.models import (
-    Notification, ChannelUser, UserTextMessage, GroupTextMessage, AbstractGroupMessage, AbstractUserMessage
+    Notification, ChannelUser, UserTextMessage, GroupTextMessage, AbstractGroupMessage, AbstractUserMessage,
+    GroupMessageQuerySet, GroupMessageInbox, unread_messages_changed, inbox_changed, chunked,
+    get_group_inbox_configuration
 )
 
 UserMessage = TypeVar('UserMessage', bound=AbstractUserMessage)
 GroupMessage = TypeVar('GroupMessage', bound=AbstractGroupMessage)
 
 
+def encode_event(dto: AbstractMessageDTO) -> dict[str, Any]:
+    """
+    Creates the channel layer event for ``MessengerConsumer.send_notification`` from the given DTO.
+    The DTO is serialized & encoded only once here, instead of once in every receiving consumer.
+
+    NOTE: The event must only contain primitive data, since it passes the Redis channel layer via msgpack.
+          Only the JSON frame is sent (no serialized content along with it), so every event is as small as possible.
+          Consumers with binary wire formats decode it once and encode it in their own format.
+
+    :param dto: DTO to send
+    :return: Channel layer event
+    """
+    return {
+        'type': 'send_notification',  # same name as function in "message.consumers.MessageConsumer"
+        'message_type': int(dto.MESSAGE_TYPE),
+        'frame': JsonCodec.encode(dto.serialize()),  # Ready-to-send frame for consumers with JSON wire format
+    }
+
+
+def _get_fanout_concurrency() -> int:
+    return getattr(settings, 'MESSENGER_FANOUT', {}).get('CONCURRENCY', 64)
+
+
+def _get_event_key(dto: AbstractMessageDTO) -> Hashable:
+    """
+    :return: The DTO itself, so equal DTOs are encoded only once, or its identifier for unhashable DTOs (list fields)
+    """
+    try:
+        hash(dto)
+    except TypeError:
+        return id(dto)
+    return dto
+
+
+async def notify_users_async(notifications: Iterable[tuple[ChannelUser | int, AbstractMessageDTO]], concurrency: Optional[int] = None) -> None:
+    """
+    Sends the given DTOs to their users. The ``group_send`` calls are pipelined with bounded concurrency,
+    and equal DTOs are encoded only once.
+
+    Example::
+
+        await notify_users_async((note.user_id, NotificationDTO(note.unread_messages)) for note in notifications)
+
+    :param notifications: Pairs of user (or primary key of user) & DTO to send to this user
+    :param concurrency: Maximum number of concurrent ``group_send`` calls, defaults to the "MESSENGER_FANOUT" setting
+    """
+    channel_layer = get_channel_layer()
+    if channel_layer is None:
+        return
+    # NOTE: The DTOs are kept along with their events, so the identifiers of unhashable DTOs are never reused meanwhile
+    events: dict[Hashable, tuple[AbstractMessageDTO, dict[str, Any]]] = {}
+    pending = iter(notifications)
+
+    async def worker() -> None:
+        # NOTE: All workers share the same iterator, every pair is sent exactly once
+        for user, dto in pending:
+            key = _get_event_key(dto)
+            cached = events.get(key)
+            if cached is None:
+                cached = events[key] = (dto, encode_event(dto))
+            event = cached[1]
+            identifier = user if isinstance(user, int) else user.pk
+            await channel_layer.group_send(ChannelUser.get_channel_name_of(identifier), event)
+
+    await asyncio.gather(*(worker() for _ in range(concurrency or _get_fanout_concurrency())))
+
+
+def notify_users(notifications: Iterable[tuple[ChannelUser | int, AbstractMessageDTO]], concurrency: Optional[int] = None) -> None:
+    """
+    Synchronous variant of ``notify_users_async(...)``, with only one transition into the event loop for all users.
+
+    :param notifications: Pairs of user (or primary key of user) & DTO to send to this user
+    :param concurrency: Maximum number of concurrent ``group_send`` calls, defaults to the "MESSENGER_FANOUT" setting
+    """
+    # NOTE: Materialize lazy iterables (e.g. QuerySets) here, the DB must not be queried within the event loop
+    notifications = list(notifications)
+    if notifications:
+        async_to_sync(notify_users_async)(notifications, concurrency)
+
+
 def _notify_user(note: Notification) -> None:
     """
     Sends notification update to user that ows this notification.
 
     :param note: Notification
     """
-    channel_layer = get_channel_layer()
-    # NOTE: You must create a function in the "message.consumers.NotificationConsumer"
-    #       class that has the same name as the "type" element from below.
-    if channel_layer is not None:
-        async_to_sync(channel_layer.group_send)(
-            note.user.get_channel_name(), {
-                'type': 'send_notification',  # same name as function in "message.consumers.MessageConsumer"
-                'dto': NotificationDTO(note.unread_messages)
-            }
-        )
+    notify_users(((note.user_id, NotificationDTO(note.unread_messages)), ))
 
 
 async def _notify_user_async(note: Notification) -> None:
@@ -38,16 +123,86 @@ async def _notify_user_async(note: Notification) -> None:
 
     :param note: Notification
     """
-    channel_layer = get_channel_layer()
-    # NOTE: You must create a function in the "message.consumers.NotificationConsumer"
-    #       class that has the same name as the "type" element from below.
-    if channel_layer is not None:
-        await channel_layer.group_send(
-            note.user.get_channel_name(), {
-                'type': 'send_notification',  # same name as function in "message.consumers.MessageConsumer"
-                'dto': NotificationDTO(note.unread_messages)
-            }
-        )
+    await notify_users_async(((note.user_id, NotificationDTO(note.unread_messages)), ))
+
+
+_PENDING = local()
+# Columns read for every notification update
+_NOTIFICATION_COLUMNS = ('user_id', 'unread_messages', 'inbox_version', 'inbox_modified')
+
+
+def _get_pending(attribute: str, using: str) -> set[int]:
+    pending: dict[str, set[int]] = getattr(_PENDING, attribute, None)
+    if pending is None:
+        pending = {}
+        setattr(_PENDING, attribute, pending)
+    return pending.setdefault(using, set())
+
+
+def _get_pending_notifications(using: str) -> set[int]:
+    return _get_pending('user_pks', using)
+
+
+def _get_pending_inbox_changes(using: str) -> set[int]:
+    return _get_pending('inbox_user_pks', using)
+
+
+def schedule_notifications(user_pks: Iterable[int], using: str = DEFAULT_DB_ALIAS) -> None:
+    """
+    Schedules a notification update for the given users, that is sent after the current transaction was committed.
+    All updates of one transaction are sent together, and every user is notified only once with his final counter.
+    Outside of transactions, the update is sent immediately.
+
+    NOTE: Counters are read after the commit, so users never see counters of rolled back writes.
+          If a transaction is rolled back, its users are notified with their (unchanged) counter on the next commit.
+          Along with the update, the version of their inboxes is bumped (@see messenger.inbox.get_inbox_version).
+
+    :param user_pks: Primary keys of users, whose notification counter changed
+    :param using: Database alias of the current transaction
+    """
+    _get_pending_notifications(using).update(user_pks)
+    # NOTE: Registered once per call on purpose, rolled back savepoints discard their callbacks.
+    #       The first callback executed after the commit sends everything, all following callbacks have nothing to do.
+    transaction.on_commit(partial(_send_scheduled_notifications, using), using=using)
+
+
+def schedule_inbox_changes(user_pks: Iterable[int], using: str = DEFAULT_DB_ALIAS) -> None:
+    """
+    Schedules a version bump of the inboxes of the given users (@see messenger.inbox.get_inbox_version), e.g. after
+    one of their messages was changed or deleted. Bumped along with the scheduled notification updates after the
+    current transaction was committed, but the users are not notified.
+
+    :param user_pks: Primary keys of users, whose inbox changed
+    :param using: Database alias of the current transaction
+    """
+    _get_pending_inbox_changes(using).update(user_pks)
+    transaction.on_commit(partial(_send_scheduled_notifications, using), using=using)
+
+
+def _send_scheduled_notifications(using: str) -> None:
+    pending = _get_pending_notifications(using)
+    changed = _get_pending_inbox_changes(using)
+    if not pending and not changed:
+        return
+    notified = set(pending)
+    user_pks = list(notified | changed)
+    pending.clear()
+    changed.clear()
+    counters: dict[int, VersionedCounter] = {}
+    versions: dict[int, InboxVersion] = {}
+    modified = timezone.now()
+    for chunk in chunked(user_pks):
+        notifications = Notification.objects.using(using).filter(user_id__in=chunk)
+        # The inbox of every notified user changed (@see messenger.inbox.get_inbox_version)
+        notifications.update(inbox_version=F('inbox_version') + 1, inbox_modified=modified)
+        for user_id, unread_messages, inbox_version, inbox_modified in notifications.values_list(*_NOTIFICATION_COLUMNS):
+            counters[user_id] = VersionedCounter(unread_messages, inbox_version)
+            versions[user_id] = InboxVersion(inbox_version, inbox_modified)
+    # Write-through, so connecting users read their counter from the cache (@see messenger.counters)
+    # NOTE: Guarded by the inbox version, so an older counter never overwrites a newer one of a concurrent commit
+    get_counter_cache().set_many(counters)
+    set_inbox_versions(versions)
+    notify_users((user_id, NotificationDTO(counter.unread_messages)) for user_id, counter in counters.items() if user_id in notified)
 
 
 @receiver(post_save, sender=ChannelUser)
@@ -109,14 +264,88 @@ def trigger_group_message_notification(sender: type[GroupMessage], instance: Gro
     :param using:
     :param kwargs: Additional keyword arguments
     """
-    if action == 'post_add':
+    if action == 'post_add' and pk_set:
         # Only trigger mechanism if save was successfully!
-        notifications = [user.notification for user in ChannelUser.objects.filter(pk__in=pk_set)]
-        for note in notifications:
-            note.unread_messages += 1
-        Notification.objects.bulk_update(notifications, ('unread_messages', ))
-        for note in notifications:
-            _notify_user(note)
+        # NOTE: If messages were added to a user (reverse), the user gets one unread message per added message
+        user_pks, increment = ((instance.pk, ), len(pk_set)) if reverse else (pk_set, 1)
+        # NOTE: Set-based updates, the counters are neither loaded nor saved one by one
+        with transaction.atomic(using=using):
+            for chunk in chunked(user_pks):
+                Notification.objects.using(using).filter(user_id__in=chunk).update(
+                    unread_messages=F('unread_messages') + increment
+                )
+        # New counters are read in one bulk read after the commit
+        schedule_notifications(user_pks, using)
+
+
+@receiver(m2m_changed, sender=GroupTextMessage.target_group.through)
+def fill_group_message_inbox(sender: type[GroupMessage], instance: GroupMessage | ChannelUser, action: str, reverse: bool, model: type, pk_set: Optional[set[int]], using: str, **kwargs) -> None:
+    """
+    If recipients are added to (or removed from) a group message, add (or remove) the message to (from) their inboxes.
+
+    @see messenger.models.GroupMessageInbox
+
+    :param sender: Through model of `GroupTextMessage.target_group`
+    :param instance: Group message, or user if the relation was changed from the user side (reverse)
+    :param action:
+    :param reverse:
+    :param model:
+    :param pk_set: Set of primary keys of added/removed users (or messages, if reverse)
+    :param using:
+    :param kwargs: Additional keyword arguments
+    """
+    if not get_group_inbox_configuration()['ENABLED'] or action not in ('post_add', 'post_remove', 'post_clear'):
+        return
+    inbox = GroupMessageInbox.objects.using(using)
+    if action == 'post_clear':
+        inbox.filter(**{'user' if reverse else 'message': instance}).delete()
+        return
+    if not pk_set:
+        return
+    message_pks, user_pks = (pk_set, (instance.pk, )) if reverse else ((instance.pk, ), pk_set)
+    for chunk in chunked(user_pks):
+        if action == 'post_remove':
+            inbox.filter(message_id__in=message_pks, user_id__in=chunk).delete()
+            continue
+        created: dict[int, datetime] = dict(GroupTextMessage.objects.using(using).filter(pk__in=message_pks).values_list('pk', 'created'))
+        # NOTE: Recipients may already be in the "received_group", e.g. if both groups are edited at once in the admin
+        received: set[tuple[int, int]] = set(GroupTextMessage.received_group.through.objects.using(using).filter(
+            grouptextmessage_id__in=message_pks, channeluser_id__in=chunk
+        ).values_list('grouptextmessage_id', 'channeluser_id'))
+        inbox.bulk_create((
+            GroupMessageInbox(
+                message_id=message_pk, user_id=user_pk, read=(message_pk, user_pk) in received, created=created[message_pk]
+            ) for message_pk in message_pks for user_pk in chunk
+        ), ignore_conflicts=True)
+
+
+@receiver(m2m_changed, sender=GroupTextMessage.received_group.through)
+def read_group_message_inbox(sender: type[GroupMessage], instance: GroupMessage | ChannelUser, action: str, reverse: bool, model: type, pk_set: Optional[set[int]], using: str, **kwargs) -> None:
+    """
+    If users read a group message (or it is marked as unread again), update the read state in their inboxes.
+
+    @see messenger.models.GroupMessageInbox
+
+    :param sender: Through model of `GroupTextMessage.received_group`
+    :param instance: Group message, or user if the relation was changed from the user side (reverse)
+    :param action:
+    :param reverse:
+    :param model:
+    :param pk_set: Set of primary keys of added/removed users (or messages, if reverse)
+    :param using:
+    :param kwargs: Additional keyword arguments
+    """
+    if not get_group_inbox_configuration()['ENABLED'] or action not in ('post_add', 'post_remove', 'post_clear'):
+        return
+    inbox = GroupMessageInbox.objects.using(using)
+    if action == 'post_clear':
+        inbox.filter(**{'user' if reverse else 'message': instance}).update(read=False)
+        return
+    if not pk_set:
+        return
+    message_pks, user_pks = (pk_set, (instance.pk, )) if reverse else ((instance.pk, ), pk_set)
+    for chunk in chunked(user_pks):
+        inbox.filter(message_id__in=message_pks, user_id__in=chunk).update(read=action == 'post_add')
 
 
 @receiver(pre_delete, sender=GroupTextMessage)
@@ -131,14 +360,105 @@ def never_received_group_message(sender: type[GroupMessage], instance: GroupMess
     :param origin:
     :param kwargs:
     """
-    # @see https://docs.djangoproject.com/en/5.0/ref/models/querysets/#exclude
-    notifications = [user.notification for user in instance.target_group.all().exclude(pk__in=instance.received_group.all())]
-    for note in notifications:
-        if note.unread_messages > 0:
-            note.unread_messages -= 1
-    Notification.objects.bulk_update(notifications, ('unread_messages', ))
-    for note in notifications:
-        _notify_user(note)
+    if GroupMessageQuerySet.is_bulk_deleting():
+        # Counters of all deleted messages are already corrected at once (@see GroupMessageQuerySet.delete)
+        return
+    decrements = sender.objects.using(using).filter(pk=instance.pk).count_unread_per_user()
+    Notification.decrement_unread_messages(decrements, using)
+
+
+@receiver(post_save, sender=UserTextMessage)
+@receiver(post_delete, sender=UserTextMessage)
+def changed_user_message_inbox(sender: type[UserMessage], instance: UserMessage, using: str, **kwargs) -> None:
+    """
+    If a user message was created, changed or deleted, bump the version of the inbox of its user
+    (@see messenger.inbox.get_inbox_version)
+
+    :param sender:
+    :param instance:
+    :param using:
+    :param kwargs:
+    """
+    schedule_inbox_changes((instance.user_id, ), using)
+
+
+@receiver(post_save, sender=GroupTextMessage)
+@receiver(pre_delete, sender=GroupTextMessage)
+def changed_group_message_inbox(sender: type[GroupMessage], instance: GroupMessage, using: str, **kwargs) -> None:
+    """
+    If a group message was changed or deleted, bump the versions of the inboxes of all its recipients
+    (@see messenger.inbox.get_inbox_version)
+
+    NOTE: Recipients of deleted messages are collected before the deletion, afterward they are unknown.
+
+    :param sender:
+    :param instance:
+    :param using:
+    :param kwargs:
+    """
+    if kwargs.get('created', False) or GroupMessageQuerySet.is_bulk_deleting():
+        # New messages have no recipients yet, bulk deletions collect the recipients of all messages at once
+        return
+    schedule_inbox_changes(sender.objects.using(using).filter(pk=instance.pk).recipients(), using)
+
+
+@receiver(m2m_changed, sender=GroupTextMessage.target_group.through)
+@receiver(m2m_changed, sender=GroupTextMessage.received_group.through)
+def changed_group_message_recipients(sender: type, instance: GroupMessage | ChannelUser, action: str, reverse: bool, model: type, pk_set: Optional[set[int]], using: str, **kwargs) -> None:
+    """
+    If recipients (or readers) of group messages changed, bump the versions of their inboxes
+    (@see messenger.inbox.get_inbox_version)
+
+    :param sender: Through model of `GroupTextMessage.target_group` or `GroupTextMessage.received_group`
+    :param instance: Group message, or user if the relation was changed from the user side (reverse)
+    :param action:
+    :param reverse:
+    :param model:
+    :param pk_set: Set of primary keys of added/removed users (or messages, if reverse)
+    :param using:
+    :param kwargs: Additional keyword arguments
+    """
+    if action in ('post_add', 'post_remove') and pk_set:
+        user_pks = (instance.pk, ) if reverse else pk_set
+    elif action == 'pre_clear':
+        # NOTE: Collected before the clear, afterward the users are unknown
+        user_pks = (instance.pk, ) if reverse else sender.objects.using(using).filter(grouptextmessage_id=instance.pk).values_list('channeluser_id', flat=True)
+    else:
+        return
+    schedule_inbox_changes(user_pks, using)
+
+
+@receiver(inbox_changed)
+def changed_inbox(sender: type, user_pks: Iterable[int], using: str, **kwargs) -> None:
+    """
+    If messages of users were changed without sending signals per message (e.g. bulk deletions), bump the versions of
+    their inboxes (@see messenger.inbox.get_inbox_version)
+
+    :param sender:
+    :param user_pks: Primary keys of the affected users
+    :param using:
+    :param kwargs:
+    """
+    schedule_inbox_changes(user_pks, using)
+
+
+@receiver(post_save, sender=UserTextMessage)
+@receiver(post_save, sender=GroupTextMessage)
+@receiver(post_delete, sender=UserTextMessage)
+@receiver(post_delete, sender=GroupTextMessage)
+def outdated_message_fragments(sender: type[UserMessage | GroupMessage], instance: UserMessage | GroupMessage, using: str, **kwargs) -> None:
+    """
+    If a message was changed (or deleted), remove its cached template fragments (@see messenger.fragments)
+
+    NOTE: Removed after the commit, otherwise a concurrent request could cache the old message again in between.
+
+    :param sender:
+    :param instance:
+    :param using:
+    :param kwargs:
+    """
+    if not kwargs.get('created', False):
+        transaction.on_commit(partial(invalidate_message, sender.message_type(), instance.pk), using=using)
 
 
 @receiver(post_save, sender=Notification)
@@ -152,4 +472,17 @@ def notification(sender: type[Notification], instance: Notification, created, **
     :param kwargs:
     """
     if not created:
-        _notify_user(instance)
+        schedule_notifications((instance.user_id, ), kwargs['using'])
+
+
+@receiver(unread_messages_changed, sender=Notification)
+def notification_counter(sender: type[Notification], user_pks: Iterable[int], using: str, **kwargs) -> None:
+    """
+    If the unread messages counters of users were updated atomically, notify these users via websocket call
+
+    :param sender:
+    :param user_pks: Primary keys of the affected users
+    :param using:
+    :param kwargs:
+    """
+    schedule_notifications(user_pks, using)
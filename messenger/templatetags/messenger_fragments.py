@@ -0,0 +1,29 @@
+from typing import Any, Iterable
+
+from django import template
+from django.utils.safestring import SafeString, mark_safe
+
+from messenger.fragments import render_message_rows, render_message_body
+
+register = template.Library()
+
+
+@register.simple_tag
+def message_rows(messages: Iterable[Any]) -> SafeString:
+    """
+    Usage: ``{% message_rows text_messages %}``
+
+    @see :func:`messenger.fragments.render_message_rows`
+    """
+    # NOTE: Fragments are rendered templates, hence already escaped
+    return mark_safe(render_message_rows(messages))
+
+
+@register.simple_tag
+def message_body(message: Any) -> SafeString:
+    """
+    Usage: ``{% message_body message %}``
+
+    @see :func:`messenger.fragments.render_message_body`
+    """
+    return mark_safe(render_message_body(message))
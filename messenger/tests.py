@@ -0,0 +1,582 @@
+import re
+from concurrent.futures import ThreadPoolExecutor
+from datetime import timedelta
+from threading import get_ident
+from random import Random
+from typing import Any, Callable, NamedTuple
+from unittest import mock
+
+from channels.layers import get_channel_layer
+from channels.testing import WebsocketCommunicator
+from django.contrib.auth.models import AnonymousUser
+from django.db import connection, transaction
+from django.http import HttpResponse
+from django.test import AsyncRequestFactory, SimpleTestCase, TestCase, TransactionTestCase, override_settings
+from django.test.utils import CaptureQueriesContext
+from django.urls import reverse
+from django.utils import timezone
+from django.utils.translation import get_language
+
+from messenger import consumers, fragments, signals, views
+from messenger.admission import RETRY_CLOSE_CODE, AdmissionController
+from messenger.codecs import CODECS, DEFAULT_CODEC, DecodeError, JsonCodec, MessagePackCodec, encode_constant, negotiate_codec
+from messenger.constants import MessageType, MESSAGE_TYPE_KEYWORD
+from messenger.consumers import UNKNOWN_DTO, MessengerConsumerDevelopment
+from messenger.counters import RedisCounterCache, VersionedCounter
+from messenger.dto import DTOValidationError, ErrorDTO, GroupTextMessageDTO, NotificationDTO
+from messenger.inbox import get_inbox_page, mark_as_read
+from messenger.models import ChannelUser, GroupTextMessage, Notification, UserTextMessage
+from messenger.outbound import OutboundQueue
+from messenger.presence import InMemoryPresenceRegistry
+
+# Backends, that keep everything within the test process, instead of requiring a Redis server
+IN_MEMORY_SETTINGS: dict[str, Any] = {
+    'CACHES': {'default': {'BACKEND': 'django.core.cache.backends.locmem.LocMemCache'}},
+    'CHANNEL_LAYERS': {'default': {'BACKEND': 'channels.layers.InMemoryChannelLayer'}},
+    'MESSENGER_COUNTERS': {'BACKEND': 'messenger.counters.InMemoryCounterCache'},
+    'MESSENGER_PRESENCE': {'BACKEND': 'messenger.presence.InMemoryPresenceRegistry'},
+}
+
+# Plan lines of full table (or full index) scans, SQLite: "SCAN <table>", PostgreSQL: "Seq Scan on <table>"
+FULL_SCAN_PATTERNS: tuple[re.Pattern, ...] = (
+    re.compile(r'\bSCAN (?P<table>messenger_\w+)'),
+    re.compile(r'\bSeq Scan on (?P<table>messenger_\w+)'),
+)
+
+
+class HotPath(NamedTuple):
+    name: str
+    # Maximum number of queries, if the path needs more it regressed
+    query_budget: int
+    run: Callable[['Dataset'], Any]
+
+
+class Dataset(NamedTuple):
+    user: ChannelUser
+    user_pks: list[int]
+    group_message: GroupTextMessage
+    inbox_cursor: str
+
+
+HOT_PATHS: tuple[HotPath, ...] = (
+    HotPath('unread user messages', 1, lambda data: UserTextMessage.get_number_of_unread_messages(data.user)),
+    HotPath('unread group messages', 1, lambda data: GroupTextMessage.get_number_of_unread_messages(data.user)),
+    HotPath('has read group message', 1, lambda data: data.group_message.has_read(data.user)),
+    HotPath('inbox first page', 1, lambda data: get_inbox_page(data.user.pk)),
+    HotPath('inbox deep page', 1, lambda data: get_inbox_page(data.user.pk, data.inbox_cursor)),
+    HotPath('recount unread messages', 2, lambda data: Notification.count_unread_messages(data.user_pks[:100])),
+    HotPath('unread per user of group message', 2, lambda data: GroupTextMessage.objects.filter(pk=data.group_message.pk).count_unread_per_user()),
+    # NOTE: Writing hot paths include the inbox version bump & re-read of the counters after the commit
+    HotPath('atomic counter increment', 4, lambda data: data.user.notification.trigger()),
+    HotPath('group message fan-out', 6, lambda data: GroupTextMessage.objects.create(title='Title', content='Content').target_group.add(*data.user_pks[:100])),
+)
+
+
+class OutboundQueueTest(SimpleTestCase):
+
+    async def test_only_the_latest_coalesced_message_is_sent(self) -> None:
+        sent: list[str] = []
+
+        async def send(message: str) -> None:
+            sent.append(message)
+
+        queue = OutboundQueue(send, flush_delay=60)
+        # NOTE: Mixed message types, coalesced & sequenced messages must never supersede each other
+        for index, message_type in enumerate((
+            MessageType.ALERT, MessageType.ALERT, MessageType.NOTIFICATION, MessageType.ALERT, MessageType.NOTIFICATION,
+            MessageType.ERROR,
+        )):
+            queue.push(message_type, f'{message_type.name}-{index}')
+        await queue.flush()
+        queue.close()
+        self.assertEqual(sent, ['ALERT-0', 'ALERT-1', 'ALERT-3', 'NOTIFICATION-4', 'ERROR-5'])
+
+
+class MessageDTOTest(SimpleTestCase):
+
+    def test_fields_are_serialized_with_camel_case_keys(self) -> None:
+        dto = ErrorDTO(404, 'Not found')
+        content = dto.serialize()
+        self.assertEqual(content, {MESSAGE_TYPE_KEYWORD: int(MessageType.ERROR), 'errorCode': 404, 'errorMessage': 'Not found'})
+        self.assertEqual(ErrorDTO.deserialize(content), dto)
+
+    def test_missing_fields_fall_back_to_their_defaults(self) -> None:
+        self.assertEqual(NotificationDTO.deserialize({MESSAGE_TYPE_KEYWORD: int(MessageType.NOTIFICATION)}), NotificationDTO(0))
+
+    def test_invalid_fields_are_rejected(self) -> None:
+        valid = GroupTextMessageDTO([1, 2], 'Title', 'Content').serialize()
+        for key, value in (
+            ('receivers', None), ('receivers', [1, True]), ('receivers', (1, 2)), ('title', 1), ('content', b'Content'),
+        ):
+            with self.subTest(key=key, value=value), self.assertRaises(DTOValidationError):
+                GroupTextMessageDTO.deserialize(valid | {key: value})
+        for key in ('receivers', 'title'):
+            with self.subTest(missing=key), self.assertRaises(DTOValidationError):
+                GroupTextMessageDTO.deserialize({k: v for k, v in valid.items() if k != key})
+        with self.assertRaises(DTOValidationError):
+            NotificationDTO.deserialize({'unreadMessages': True})
+
+
+class CodecTest(SimpleTestCase):
+    CONTENT: dict[str, Any] = {MESSAGE_TYPE_KEYWORD: int(MessageType.ALERT), 'title': 'Tïtle', 'userIds': [1, 2], 'read': False}
+
+    def test_round_trip(self) -> None:
+        for codec in CODECS.values():
+            with self.subTest(codec.SUBPROTOCOL):
+                frame = codec.encode(self.CONTENT)
+                self.assertIsInstance(frame, bytes if codec.BINARY else str)
+                self.assertEqual(codec.decode(frame), self.CONTENT)
+
+    def test_malformed_frames_raise_decode_errors(self) -> None:
+        for codec in CODECS.values():
+            # NOTE: Truncated frames, frames of other codecs & valid frames without an object
+            for frame in (codec.encode(self.CONTENT)[:-3], b'\xc1\xff', codec.encode([1, 2]), codec.encode('text')):  # noqa
+                with self.subTest(codec.SUBPROTOCOL, frame=frame), self.assertRaises(DecodeError):
+                    codec.decode(frame)
+
+    def test_negotiation_prefers_the_order_of_the_client(self) -> None:
+        self.assertEqual(negotiate_codec(['unknown', MessagePackCodec.SUBPROTOCOL, JsonCodec.SUBPROTOCOL]), (MessagePackCodec, MessagePackCodec.SUBPROTOCOL))
+        self.assertEqual(negotiate_codec(['unknown']), (DEFAULT_CODEC, None))
+
+
+@override_settings(**IN_MEMORY_SETTINGS)
+class PresenceRegistryTest(SimpleTestCase):
+    TTL: float = 60
+
+    async def test_expired_leases_are_evicted_from_registry_and_group(self) -> None:
+        registry = InMemoryPresenceRegistry(self.TTL, heartbeat_interval=20)
+        channel_layer = get_channel_layer()
+        alive, ghost = await channel_layer.new_channel(), await channel_layer.new_channel()
+        for channel_name in (alive, ghost):
+            await channel_layer.group_add('presence', channel_name)
+        now = registry._now()
+        with mock.patch.object(registry, '_ensure_heartbeat'):
+            await registry.register(alive, 'presence')
+        # NOTE: Lease of a dead worker process, that is never refreshed by any heartbeat
+        await registry._store_leases({ghost: 'presence'}, now + self.TTL)
+        with mock.patch.object(registry, '_now', return_value=now + self.TTL + 1):
+            self.assertFalse(await registry.exists(ghost))
+            await registry.heartbeat()
+            self.assertTrue(await registry.exists(alive))
+        self.assertEqual(await registry._pop_expired_leases(now + self.TTL + 1), {})
+        self.assertEqual(set(channel_layer.groups['presence']), {alive})
+
+
+    async def test_lookups_are_cached_until_the_channel_is_unregistered(self) -> None:
+        registry = InMemoryPresenceRegistry(self.TTL, heartbeat_interval=20, cache_ttl=5)
+        channel_name = await get_channel_layer().new_channel()
+        with mock.patch.object(registry, '_ensure_heartbeat'):
+            await registry.register(channel_name, 'presence')
+        with mock.patch.object(registry, '_has_lease', wraps=registry._has_lease) as has_lease:
+            for _ in range(3):
+                self.assertTrue(await registry.exists(channel_name))
+            has_lease.assert_not_called()
+            await registry.unregister(channel_name)
+            self.assertFalse(await registry.exists(channel_name))
+            self.assertFalse(await registry.exists(channel_name))
+            has_lease.assert_called_once()
+
+
+@override_settings(**IN_MEMORY_SETTINGS)
+class MessengerConsumerTest(SimpleTestCase):
+
+    @staticmethod
+    def _communicator(*subprotocols: str) -> WebsocketCommunicator:
+        communicator = WebsocketCommunicator(MessengerConsumerDevelopment.as_asgi(), '/ws/notify/', subprotocols=list(subprotocols))
+        # NOTE: Never saved, the consumer only needs the primary key of the user
+        communicator.scope['user'] = ChannelUser(pk=1, username='consumer')
+        return communicator
+
+    async def test_message_types_are_type_exact(self) -> None:
+        communicator = self._communicator()
+        connected, _ = await communicator.connect()
+        self.assertTrue(connected)
+        try:
+            for message_type in (True, float(MessageType.NOTIFICATION), str(int(MessageType.NOTIFICATION)), None, [1]):
+                with self.subTest(message_type=message_type):
+                    await communicator.send_json_to({MESSAGE_TYPE_KEYWORD: message_type})
+                    self.assertEqual(await communicator.receive_json_from(), UNKNOWN_DTO.serialize())
+        finally:
+            await communicator.disconnect()
+
+
+    async def test_handshakes_beyond_the_admission_limit_are_closed_with_a_retry_hint(self) -> None:
+        admission = AdmissionController(max_concurrent=1, queue_timeout=0.01, retry_after=3)
+        # NOTE: Occupied by another (never ending) handshake
+        await admission.acquire()
+        communicator = self._communicator()
+        with mock.patch.object(consumers, 'get_admission_controller', return_value=admission), \
+                mock.patch.object(MessengerConsumerDevelopment, 'remember_group') as remember_group, \
+                mock.patch.object(MessengerConsumerDevelopment, 'forget_group') as forget_group:
+            connected, _ = await communicator.connect()
+            self.assertTrue(connected)
+            close = await communicator.receive_output()
+            await communicator.disconnect()
+        self.assertEqual(close, {'type': 'websocket.close', 'code': RETRY_CLOSE_CODE, 'reason': 'retry-after:3'})
+        # NOTE: Rejected channels never touch the presence registry
+        remember_group.assert_not_called()
+        forget_group.assert_not_called()
+
+    async def test_binary_clients_receive_notifications_in_their_wire_format(self) -> None:
+        communicator = self._communicator(MessagePackCodec.SUBPROTOCOL)
+        connected, subprotocol = await communicator.connect()
+        self.assertEqual((connected, subprotocol), (True, MessagePackCodec.SUBPROTOCOL))
+        try:
+            await signals.notify_users_async(((1, NotificationDTO(5)), ))
+            self.assertEqual(MessagePackCodec.decode(await communicator.receive_from()), NotificationDTO(5).serialize())
+        finally:
+            await communicator.disconnect()
+
+
+class AsyncTemplateViewTest(SimpleTestCase):
+
+    class FragmentView(views.AsyncNotificationView):
+        renders_fragments = True
+
+    async def test_blocking_fragment_caches_are_rendered_outside_of_the_event_loop(self) -> None:
+        view = self.FragmentView.as_view()
+        for backend, blocking in (('messenger.fragments.SharedFragmentCache', True), ('messenger.fragments.LRUFragmentCache', False)):
+            request = AsyncRequestFactory().get('/')
+            request.auser = mock.AsyncMock(return_value=AnonymousUser())
+            with self.subTest(backend), override_settings(MESSENGER_FRAGMENTS={'BACKEND': backend}), \
+                    mock.patch.object(views, 'render', side_effect=lambda *args, **kwargs: HttpResponse(str(get_ident()))):
+                response = await view(request)
+                self.assertEqual(int(response.content) != get_ident(), blocking)
+
+
+@override_settings(**IN_MEMORY_SETTINGS)
+class NotifyUsersTest(SimpleTestCase):
+
+    async def test_unhashable_dtos_are_sent(self) -> None:
+        channel_layer = get_channel_layer()
+        channel_name = await channel_layer.new_channel()
+        await channel_layer.group_add(ChannelUser.get_channel_name_of(1), channel_name)
+        dto = GroupTextMessageDTO([1, 2], 'Title', 'Content')
+        await signals.notify_users_async(((1, dto), (1, NotificationDTO(3)), (1, NotificationDTO(3))))
+        events = [await channel_layer.receive(channel_name) for _ in range(3)]
+        self.assertEqual([JsonCodec.decode(event['frame']) for event in events], [dto.serialize(), NotificationDTO(3).serialize(), NotificationDTO(3).serialize()])
+
+    def test_unhashable_constants_are_encoded(self) -> None:
+        dto = GroupTextMessageDTO([1], 'Title', 'Content')
+        self.assertEqual(encode_constant(JsonCodec, dto), JsonCodec.encode(dto.serialize()))
+
+    def test_nothing_to_send_stays_out_of_the_event_loop(self) -> None:
+        with mock.patch.object(signals, 'async_to_sync') as async_to_sync:
+            signals.notify_users(())
+        async_to_sync.assert_not_called()
+
+
+class RedisCounterCacheTest(SimpleTestCase):
+
+    @override_settings(MESSENGER_COUNTERS={'CHUNK_SIZE': 2})
+    def test_counters_are_compared_and_set_in_chunks(self) -> None:
+        cache = RedisCounterCache()
+        user_pks = range(-5, 0)
+        self.addCleanup(cache.delete_many, user_pks)
+        cache.set_many({-1: VersionedCounter(7, 10)})
+        with mock.patch.object(RedisCounterCache, '_compare_and_set', autospec=True, side_effect=RedisCounterCache._compare_and_set) as compare_and_set:
+            cache.set_many({user_pk: VersionedCounter(1, 5) for user_pk in user_pks})
+        self.assertEqual([len(call.args[2]) for call in compare_and_set.call_args_list], [2, 2, 1])
+        # NOTE: The newer counter is kept
+        self.assertEqual(cache.get_many(user_pks), {-5: 1, -4: 1, -3: 1, -2: 1, -1: 7})
+
+
+@override_settings(**IN_MEMORY_SETTINGS)
+class ScheduledNotificationsTest(TestCase):
+
+    def test_one_update_per_commit(self) -> None:
+        user = ChannelUser.objects.create(username='scheduled')
+        with mock.patch.object(signals, 'notify_users') as notify_users, self.captureOnCommitCallbacks(execute=True) as callbacks:
+            with transaction.atomic():
+                for _ in range(3):
+                    UserTextMessage.objects.create(user=user, title='Title', content='Content')
+                GroupTextMessage.objects.create(title='Title', content='Content').target_group.add(user)
+        self.assertGreater(len(callbacks), 1)
+        notify_users.assert_called_once()
+        self.assertEqual(list(notify_users.call_args.args[0]), [(user.pk, NotificationDTO(4))])
+        self.assertEqual(Notification.objects.values_list('inbox_version', flat=True).get(user=user), 1)
+
+
+@override_settings(**IN_MEMORY_SETTINGS)
+class AutocommitNotificationsTest(TransactionTestCase):
+
+    def test_one_update_per_saved_message(self) -> None:
+        user = ChannelUser.objects.create(username='autocommit')
+        with mock.patch.object(signals, 'notify_users') as notify_users:
+            UserTextMessage.objects.create(user=user, title='Title', content='Content')
+        notify_users.assert_called_once()
+        self.assertEqual(list(notify_users.call_args.args[0]), [(user.pk, NotificationDTO(1))])
+        self.assertEqual(Notification.objects.values_list('inbox_version', flat=True).get(user=user), 1)
+
+
+@override_settings(**IN_MEMORY_SETTINGS)
+class GroupMessageCounterTest(TestCase):
+    COUNTER_UPDATE_PREFIX: str = 'UPDATE "messenger_notification" SET "unread_messages"'
+
+    @classmethod
+    def setUpTestData(cls) -> None:
+        cls.users = [ChannelUser.objects.create(username=f'group-{index}') for index in range(5)]
+
+    def _get_counters(self) -> list[int]:
+        counters = dict(Notification.objects.filter(user__in=self.users).values_list('user_id', 'unread_messages'))
+        return [counters[user.pk] for user in self.users]
+
+    def _count_counter_updates(self, queries: CaptureQueriesContext) -> int:
+        return sum(query['sql'].startswith(self.COUNTER_UPDATE_PREFIX) for query in queries.captured_queries)
+
+    def test_recipients_are_incremented_in_one_update(self) -> None:
+        message = GroupTextMessage.objects.create(title='Title', content='Content')
+        with CaptureQueriesContext(connection) as queries:
+            message.target_group.add(*self.users)
+        self.assertEqual(self._count_counter_updates(queries), 1)
+        self.assertEqual(self._get_counters(), [1, 1, 1, 1, 1])
+        # NOTE: Reverse, the user gets one unread message per added message
+        messages = [GroupTextMessage.objects.create(title='Title', content='Content') for _ in range(2)]
+        with CaptureQueriesContext(connection) as queries:
+            self.users[0].grouptextmessage_target_set.add(*messages)
+        self.assertEqual(self._count_counter_updates(queries), 1)
+        self.assertEqual(self._get_counters(), [3, 1, 1, 1, 1])
+
+
+    def test_bulk_deletions_decrement_by_the_unread_messages_per_user(self) -> None:
+        messages = [GroupTextMessage.objects.create(title='Title', content='Content') for _ in range(3)]
+        for message in messages:
+            message.target_group.add(*self.users)
+        messages[0].received_group.add(self.users[0])
+        # NOTE: Drifted counter, the decrements never go below 0
+        Notification.objects.filter(user=self.users[1]).update(unread_messages=1)
+        with CaptureQueriesContext(connection) as queries:
+            GroupTextMessage.objects.filter(pk__in=[message.pk for message in messages]).delete()
+        # One update per distinct decrement (2 & 3 unread messages)
+        self.assertEqual(self._count_counter_updates(queries), 2)
+        self.assertEqual(self._get_counters(), [3 - 2, 0, 0, 0, 0])
+
+
+@override_settings(**IN_MEMORY_SETTINGS)
+class InboxTest(TestCase):
+    MESSAGES: int = 3
+
+    def _create_inbox(self, username: str) -> ChannelUser:
+        """
+        :return: User with user & group messages, all of them created at the same time
+        """
+        user = ChannelUser.objects.create(username=username)
+        created = timezone.now()
+        for _ in range(self.MESSAGES):
+            UserTextMessage.objects.create(user=user, title='Title', content='Content')
+            GroupTextMessage.objects.create(title='Title', content='Content')
+        UserTextMessage.objects.filter(user=user).update(created=created)
+        # NOTE: Before the recipients are added, so the group message inbox copies the same time of creation
+        GroupTextMessage.objects.update(created=created)
+        for message in GroupTextMessage.objects.all():
+            message.target_group.add(user)
+        return user
+
+    def test_pages_neither_skip_nor_repeat_messages_created_at_the_same_time(self) -> None:
+        for index, group_inbox in enumerate(({'ENABLED': False}, {'ENABLED': True, 'READ': True})):
+            with self.subTest(group_inbox=group_inbox), override_settings(MESSENGER_GROUP_INBOX=group_inbox):
+                GroupTextMessage.objects.all().delete()
+                user = self._create_inbox(f'inbox-{index}')
+                expected = sorted(
+                    [(MessageType.USER_TEXT_MESSAGE, pk) for pk in UserTextMessage.objects.filter(user=user).values_list('pk', flat=True)]
+                    + [(MessageType.GROUP_TEXT_MESSAGE, pk) for pk in GroupTextMessage.objects.values_list('pk', flat=True)]
+                )
+                listed: list[tuple[MessageType, int]] = []
+                cursor = None
+                while True:
+                    page = get_inbox_page(user.pk, cursor, page_size=2)
+                    listed.extend((message.message_type, message.id) for message in page.messages)
+                    if (cursor := page.next_cursor) is None:
+                        break
+                self.assertEqual(listed, expected)
+
+
+    def test_mark_as_read_counts_only_unread_messages(self) -> None:
+        user = self._create_inbox('read')
+        user_message_pk = UserTextMessage.objects.filter(user=user).values_list('pk', flat=True).first()
+        group_message_pk = GroupTextMessage.objects.values_list('pk', flat=True).first()
+        for user_message_pks, group_message_pks, read, unread in (
+            ([user_message_pk], [group_message_pk], 2, 2 * self.MESSAGES - 2),
+            ([user_message_pk], [group_message_pk], 0, 2 * self.MESSAGES - 2),
+            (None, None, 2 * self.MESSAGES - 2, 0),
+            (None, None, 0, 0),
+        ):
+            with mock.patch.object(signals, 'notify_users') as notify_users, self.captureOnCommitCallbacks(execute=True):
+                self.assertEqual(mark_as_read(user, user_message_pks, group_message_pks), read)
+            self.assertEqual(Notification.objects.values_list('unread_messages', flat=True).get(user=user), unread)
+            if read:
+                # NOTE: One notification update, no matter how many messages were read
+                notify_users.assert_called_once()
+                self.assertEqual(list(notify_users.call_args.args[0]), [(user.pk, NotificationDTO(unread))])
+        self.assertTrue(all(message.received for message in get_inbox_page(user.pk).messages))
+
+
+@override_settings(**IN_MEMORY_SETTINGS)
+class MessageOverviewTest(TestCase):
+
+    def setUp(self) -> None:
+        self.user = ChannelUser.objects.create(username='overview')
+        self.client.force_login(self.user)
+
+    def test_unchanged_inbox_is_not_modified(self) -> None:
+        response = self.client.get(reverse('message-overview'))
+        self.assertEqual(response.status_code, 200)
+        etag = response.headers['ETag']
+        response = self.client.get(reverse('message-overview'), headers={'If-None-Match': etag})
+        self.assertEqual(response.status_code, 304)
+        self.assertEqual(response.headers['ETag'], etag)
+        with self.captureOnCommitCallbacks(execute=True):
+            UserTextMessage.objects.create(user=self.user, title='Title', content='Content')
+        response = self.client.get(reverse('message-overview'), headers={'If-None-Match': etag})
+        self.assertEqual(response.status_code, 200)
+        self.assertNotEqual(response.headers['ETag'], etag)
+
+
+@override_settings(**IN_MEMORY_SETTINGS)
+class FragmentCacheTest(TestCase):
+    BACKENDS: tuple[str, ...] = ('messenger.fragments.SharedFragmentCache', 'messenger.fragments.LRUFragmentCache')
+
+    def test_fragments_are_invalidated_after_save_and_delete(self) -> None:
+        user = ChannelUser.objects.create(username='fragments')
+        for backend in self.BACKENDS:
+            with self.subTest(backend), override_settings(MESSENGER_FRAGMENTS={'BACKEND': backend}):
+                message = UserTextMessage.objects.create(user=user, title='Title', content='Before')
+                self.assertIn('Before', fragments.render_message_body(message))
+                message.content = 'After'
+                with self.captureOnCommitCallbacks(execute=True):
+                    message.save()
+                self.assertIn('After', fragments.render_message_body(message))
+                key = fragments._get_body_key(MessageType.USER_TEXT_MESSAGE, message.pk, get_language(), timezone.get_current_timezone_name())
+                with self.captureOnCommitCallbacks(execute=True):
+                    message.delete()
+                self.assertEqual(fragments.get_fragment_cache().get_many([key]), {})
+
+    def test_lru_fragments_are_evicted_and_expire(self) -> None:
+        cache = fragments.LRUFragmentCache(max_entries=2, timeout=60)
+        cache.set_many({'a': 'A', 'b': 'B'})
+        cache.get_many(['a'])
+        cache.set_many({'c': 'C'})
+        # NOTE: "b" was used least recently
+        self.assertEqual(cache.get_many(['a', 'b', 'c']), {'a': 'A', 'c': 'C'})
+        with mock.patch.object(fragments, 'monotonic', return_value=fragments.monotonic() + 61):
+            self.assertEqual(cache.get_many(['a', 'c']), {})
+
+
+@override_settings(**IN_MEMORY_SETTINGS)
+class NotificationCounterTest(TestCase):
+    """
+    Checks that every counter update is a single set-based update within the DB, and never a read-modify-write.
+    """
+    UPDATE_PATTERN: re.Pattern = re.compile(r'^UPDATE "messenger_notification" SET "unread_messages" = (?P<value>.+?) WHERE')
+
+    def test_counter_updates_are_single_atomic_updates(self) -> None:
+        note = ChannelUser.objects.create(username='counter').notification
+        for update, expected_value, expected_counter in (
+            (note.trigger, r'\("messenger_notification"\."unread_messages" \+ 1\)', 1),
+            (note.read_one_message, r'\("messenger_notification"\."unread_messages" - 1\)', 0),
+            (note.clear_notifications, r'0', 0),
+        ):
+            with self.subTest(update.__name__), CaptureQueriesContext(connection) as queries:
+                self.assertEqual(update(), expected_counter)
+            updates = [query['sql'] for query in queries.captured_queries if query['sql'].startswith('UPDATE')]
+            self.assertEqual(len(updates), 1, updates)
+            self.assertRegex(self.UPDATE_PATTERN.match(updates[0])['value'], f'^{expected_value}$')
+
+
+@override_settings(**IN_MEMORY_SETTINGS)
+class NotificationCounterStressTest(TransactionTestCase):
+    """
+    Updates the unread counter of one user from many threads (each with its own DB connection), and checks that no
+    update was lost.
+    """
+    THREADS: int = 16
+    INCREMENTS: int = 50
+    # NOTE: Less than the increments, otherwise the clamped decrements make the final counter depend on the scheduling
+    DECREMENTS: int = 20
+
+    def test_concurrent_updates_are_not_lost(self) -> None:
+        user = ChannelUser.objects.create(username='stress')
+        with ThreadPoolExecutor(max_workers=self.THREADS) as executor:
+            for future in [executor.submit(self._hammer, user.pk) for _ in range(self.THREADS)]:
+                future.result()
+        self.assertEqual(
+            Notification.objects.values_list('unread_messages', flat=True).get(user=user),
+            self.THREADS * (self.INCREMENTS - self.DECREMENTS),
+        )
+
+    def _hammer(self, user_pk: int) -> None:
+        try:
+            note = Notification.objects.get(user_id=user_pk)
+            for _ in range(self.INCREMENTS):
+                note.trigger()
+            for _ in range(self.DECREMENTS):
+                note.read_one_message()
+        finally:
+            # NOTE: Every thread has its own DB connection
+            connection.close()
+
+
+@override_settings(**IN_MEMORY_SETTINGS)
+class QueryPlanTest(TestCase):
+    """
+    Seeds a synthetic dataset, captures the query plans & query counts of all hot paths, and fails if a plan falls back
+    to a full table scan or a query count exceeds its budget.
+    """
+    USERS: int = 2000
+    USER_MESSAGES: int = 20
+    GROUP_MESSAGES: int = 200
+    # Number of recipients per group message
+    GROUP_SIZE: int = 200
+
+    @classmethod
+    def setUpTestData(cls) -> None:
+        random = Random(42)
+        now = timezone.now()
+        ChannelUser.objects.bulk_create(ChannelUser(username=f'query-plan-{index}') for index in range(cls.USERS))
+        user_pks: list[int] = list(ChannelUser.objects.filter(username__startswith='query-plan-').values_list('pk', flat=True))
+        Notification.objects.bulk_create(Notification(user_id=user_pk) for user_pk in user_pks)
+        UserTextMessage.objects.bulk_create(
+            UserTextMessage(user_id=user_pk, title='Title', content='Content', received=random.random() < 0.5)
+            for user_pk in user_pks for _ in range(cls.USER_MESSAGES)
+        )
+        GroupTextMessage.objects.bulk_create(GroupTextMessage(title='Title', content='Content') for _ in range(cls.GROUP_MESSAGES))
+        message_pks: list[int] = list(GroupTextMessage.objects.values_list('pk', flat=True))
+        target_through = GroupTextMessage.target_group.through
+        received_through = GroupTextMessage.received_group.through
+        targets = [(message_pk, user_pk) for message_pk in message_pks for user_pk in random.sample(user_pks, cls.GROUP_SIZE)]
+        target_through.objects.bulk_create(target_through(grouptextmessage_id=m, channeluser_id=u) for m, u in targets)
+        received_through.objects.bulk_create(received_through(grouptextmessage_id=m, channeluser_id=u) for m, u in targets if random.random() < 0.5)
+        # NOTE: "auto_now_add" ignores given values, so the messages are spread over time afterward
+        for offset, message_pk in enumerate(message_pks):
+            GroupTextMessage.objects.filter(pk=message_pk).update(created=now - timedelta(minutes=offset))
+        with connection.cursor() as cursor:
+            # Up-to-date statistics, otherwise the planner may prefer full scans of (supposedly) small tables
+            cursor.execute('ANALYZE')
+        user = ChannelUser.objects.select_related('notification').get(pk=user_pks[0])
+        cls.data = Dataset(
+            user=user,
+            user_pks=user_pks,
+            group_message=GroupTextMessage.objects.get(pk=message_pks[0]),
+            inbox_cursor=get_inbox_page(user.pk, page_size=cls.USER_MESSAGES // 2).next_cursor,
+        )
+
+    def test_hot_paths_use_indexes_within_their_query_budgets(self) -> None:
+        for hot_path in HOT_PATHS:
+            with self.subTest(hot_path.name):
+                # NOTE: Includes the queries after the (simulated) commit, e.g. of the counter write-through.
+                #       Writing hot paths come last, so they do not change the dataset for the reading ones.
+                with CaptureQueriesContext(connection) as queries, self.captureOnCommitCallbacks(execute=True):
+                    hot_path.run(self.data)
+                statements = [query['sql'] for query in queries.captured_queries if not query['sql'].startswith(('SAVEPOINT', 'RELEASE', 'ROLLBACK'))]
+                self.assertLessEqual(len(statements), hot_path.query_budget, '\n'.join(statements))
+                for sql in statements:
+                    plan = self._explain(sql)
+                    for pattern in FULL_SCAN_PATTERNS:
+                        match = pattern.search(plan)
+                        self.assertIsNone(match, f'Full scan of "{match and match["table"]}" in: {sql}\n{plan}')
+
+    @staticmethod
+    def _explain(sql: str) -> str:
+        with connection.cursor() as cursor:
+            cursor.execute(f'{connection.ops.explain_query_prefix()} {sql}')
+            return '\n'.join(' '.join(str(column) for column in row) for row in cursor.fetchall())
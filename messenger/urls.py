@@ -1,12 +1,32 @@
 __author__ = 'Richard Saeuberlich'
 
-from django.urls import path
+from django.urls import path, URLPattern
 
-from messenger.views import NotificationView, MessageOverview, UserMessageView, GroupMessageView
+from messenger.views import (
+    NotificationView, MessageOverview, UserMessageView, GroupMessageView, MarkAsReadView, MetricsView, ReadinessView,
+    AsyncNotificationView, AsyncMessageOverview, AsyncUserMessageView, AsyncGroupMessageView, use_asynchronous_views
+)
 
-urlpatterns = [
-    path('', NotificationView.as_view(), name='notifications'),
-    path('overview', MessageOverview.as_view(), name='message-overview'),
-    path('user/<int:identifier>', UserMessageView.as_view(), name='user-message'),
-    path('group/<int:identifier>', GroupMessageView.as_view(), name='group-message'),
-]
+
+def get_urlpatterns(asynchronous: bool) -> list[URLPattern]:
+    """
+    :param asynchronous: Serve the message views by their asynchronous variants
+    :return: All URL patterns of the messenger
+    """
+    if asynchronous:
+        views = (AsyncNotificationView, AsyncMessageOverview, AsyncUserMessageView, AsyncGroupMessageView)
+    else:
+        views = (NotificationView, MessageOverview, UserMessageView, GroupMessageView)
+    notification_view, message_overview, user_message_view, group_message_view = views
+    return [
+        path('', notification_view.as_view(), name='notifications'),
+        path('overview', message_overview.as_view(), name='message-overview'),
+        path('user/<int:identifier>', user_message_view.as_view(), name='user-message'),
+        path('group/<int:identifier>', group_message_view.as_view(), name='group-message'),
+        path('read', MarkAsReadView.as_view(), name='mark-as-read'),
+        path('metrics', MetricsView.as_view(), name='metrics'),
+        path('ready', ReadinessView.as_view(), name='ready'),
+    ]
+
+
+urlpatterns = get_urlpatterns(use_asynchronous_views())
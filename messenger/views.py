@@ -1,14 +1,35 @@
-from dataclasses import dataclass
-from datetime import datetime
-from operator import attrgetter
-from typing import Any, Optional
+import json
+from typing import Any, ClassVar, Optional
 
+from asgiref.sync import sync_to_async
+from django.conf import settings
+from django.http import HttpRequest, HttpResponse, HttpResponseBadRequest, HttpResponseForbidden, JsonResponse
+from django.middleware.csrf import get_token
+from django.shortcuts import render
+from django.utils.cache import get_conditional_response, patch_cache_control
+from django.utils.http import http_date, quote_etag
+from django.utils.translation import get_language
+from django.views import View
 from django.views.generic import TemplateView
+from django.views.generic.base import ContextMixin, TemplateResponseMixin
 
 from messenger.constants import MessageType
+from messenger.fragments import get_fragment_cache
+from messenger.inbox import (
+    InboxVersion, get_inbox_page, aget_inbox_page, get_inbox_version, aget_inbox_version, mark_as_read, amark_as_read
+)
+from messenger.metrics import REGISTRY
+from messenger.warmup import is_ready, ensure_warm_up
 from messenger.models import UserTextMessage, ChannelUser, GroupTextMessage
 
 
+def use_asynchronous_views() -> bool:
+    """
+    :return: True, if the message views are served by their asynchronous variants (``MESSENGER_VIEWS`` setting)
+    """
+    return getattr(settings, 'MESSENGER_VIEWS', {}).get('ASYNCHRONOUS', False)
+
+
 class NotificationView(TemplateView):
     template_name = 'messenger/notifications.html'
 
@@ -18,29 +39,53 @@ class NotificationView(TemplateView):
         return context
 
 
-@dataclass
-class MessageMetaData:
-    message_type: MessageType
-    id: int
-    created: datetime
-    title: str
-    received: bool
+def _get_not_modified(request: HttpRequest, user: ChannelUser, version: InboxVersion) -> Optional[HttpResponse]:
+    """
+    :return: "Not Modified" response, if the client already has the current page of the inbox, otherwise "None"
+    """
+    return get_conditional_response(request, etag=_get_etag(user, version), last_modified=int(version.modified.timestamp()))
+
+
+def _set_validators(request: HttpRequest, response: HttpResponse, user: ChannelUser, version: InboxVersion) -> HttpResponse:
+    """
+    Lets clients revalidate the given page of the inbox with its version, instead of loading it again.
+    """
+    response.headers['ETag'] = _get_etag(user, version)
+    response.headers['Last-Modified'] = http_date(version.modified.timestamp())
+    # NOTE: Always revalidated, and never stored by shared caches (pages are personal)
+    patch_cache_control(response, private=True, no_cache=True)
+    # NOTE: The page reads the CSRF token from its cookie, which is (re)set along with every response, even "304"s
+    get_token(request)
+    return response
+
+
+def _get_etag(user: ChannelUser, version: InboxVersion) -> str:
+    # NOTE: Also depends on the language, the same inbox is rendered differently in every language
+    return quote_etag(f'{user.pk}.{version.version}.{get_language()}')
 
 
 class MessageOverview(TemplateView):
+    """
+    Answers with "304 Not Modified" (without querying the inbox), if the inbox of the user did not change since the
+    client loaded the page (@see :func:`messenger.inbox.get_inbox_version`).
+    """
     template_name = 'messenger/overview.html'
 
+    def get(self, request: HttpRequest, *args, **kwargs) -> HttpResponse:
+        user: ChannelUser = request.user  # noqa
+        if user.is_anonymous:
+            return super().get(request, *args, **kwargs)
+        version = get_inbox_version(user.pk)
+        response = _get_not_modified(request, user, version) or super().get(request, *args, **kwargs)
+        return _set_validators(request, response, user, version)
+
     def get_context_data(self, **kwargs) -> dict[str, Any]:
         context = super().get_context_data(**kwargs)
         user: ChannelUser = self.request.user  # noqa
-        # @see messenger.models.AbstractUserMessage.user
-        messages: list[MessageMetaData] = [
-            MessageMetaData(MessageType.USER_TEXT_MESSAGE, msg.pk, msg.created, msg.title, msg.received) for msg in user.usertextmessage_set.order_by('created').all()
-        ]
-        # @see messenger.models.AbstractGroupMessage.received_group
-        for msg in user.grouptextmessage_target_set.order_by('created').all():
-            messages.append(MessageMetaData(MessageType.GROUP_TEXT_MESSAGE, msg.pk, msg.created, msg.title, msg.has_read(user)))
-        context['text_messages'] = sorted(messages, key=attrgetter('created'))  # Sort for time of creation
+        # @see messenger.inbox.get_inbox_page
+        page = get_inbox_page(user.pk, self.request.GET.get('cursor'))
+        context['text_messages'] = page.messages  # Sorted for time of creation
+        context['next_cursor'] = page.next_cursor
         context['user_message_type'] = MessageType.USER_TEXT_MESSAGE
         context['group_message_type'] = MessageType.GROUP_TEXT_MESSAGE
         return context
@@ -51,13 +96,10 @@ class UserMessageView(TemplateView):
 
     def get_context_data(self, identifier: Optional[int] = None, **kwargs) -> dict[str, Any]:
         context = super().get_context_data(**kwargs)
-        # Mark message as received
-        message = UserTextMessage.objects.get(id=identifier)
-        message.received = True
-        message.save()
-        # Trigger notification reduction by 1
         user: ChannelUser = self.request.user  # noqa
-        user.notification.read_one_message()
+        message = UserTextMessage.objects.get(id=identifier)
+        # Mark message as received & trigger notification reduction by 1 (if it was unread)
+        mark_as_read(user, user_message_pks=(identifier, ), group_message_pks=())
         # Finally present message on view
         context['message'] = message
         return context
@@ -69,13 +111,162 @@ class GroupMessageView(TemplateView):
     def get_context_data(self, identifier: Optional[int] = None, **kwargs) -> dict[str, Any]:
         context = super().get_context_data(**kwargs)
         user: ChannelUser = self.request.user  # noqa
-        # Mark message as received
         message = GroupTextMessage.objects.get(id=identifier)
-        if not message.received_group.filter(pk=user.pk).exists():
-            message.received_group.add(user)
-            message.save()
-            # Trigger notification reduction by 1
-            user.notification.read_one_message()
+        # Mark message as received & trigger notification reduction by 1 (if it was unread)
+        mark_as_read(user, user_message_pks=(), group_message_pks=(identifier, ))
+        # Finally present message on view
+        context['message'] = message
+        return context
+
+
+class AsyncTemplateView(TemplateResponseMixin, ContextMixin, View):
+    """
+    Asynchronous variant of ``TemplateView``. The context is collected with the asynchronous ORM, and the template is
+    rendered right away within the event loop, so the response needs no further hop into the thread pool of the ASGI
+    handler (as a lazily rendered ``TemplateResponse`` would). Templates with cached fragments are rendered in a thread
+    instead, if the fragment cache waits for network I/O (@see messenger.fragments.AbstractFragmentCache.BLOCKING).
+
+    NOTE: The user is loaded asynchronously up front, since templates (and context processors) must not query the
+          database lazily within the event loop.
+    """
+    # The template renders message fragments (@see messenger.fragments)
+    renders_fragments: ClassVar[bool] = False
+
+    async def get(self, request: HttpRequest, *args, **kwargs) -> HttpResponse:
+        request.user = await request.auser()  # noqa
+        context = await self.aget_context_data(**kwargs)
+        if self.renders_fragments and get_fragment_cache().BLOCKING:
+            return await sync_to_async(render)(request, self.get_template_names(), context, content_type=self.content_type)
+        return render(request, self.get_template_names(), context, content_type=self.content_type)
+
+    async def aget_context_data(self, **kwargs) -> dict[str, Any]:
+        return self.get_context_data(**kwargs)
+
+
+class AsyncNotificationView(AsyncTemplateView):
+    """
+    Asynchronous variant of ``NotificationView``
+    """
+    template_name = NotificationView.template_name
+
+
+class AsyncMessageOverview(AsyncTemplateView):
+    """
+    Asynchronous variant of ``MessageOverview``
+    """
+    template_name = MessageOverview.template_name
+    renders_fragments = True
+
+    async def get(self, request: HttpRequest, *args, **kwargs) -> HttpResponse:
+        user: ChannelUser = await request.auser()  # noqa
+        if user.is_anonymous:
+            return await super().get(request, *args, **kwargs)
+        version = await aget_inbox_version(user.pk)
+        response = _get_not_modified(request, user, version) or await super().get(request, *args, **kwargs)
+        return _set_validators(request, response, user, version)
+
+    async def aget_context_data(self, **kwargs) -> dict[str, Any]:
+        context = await super().aget_context_data(**kwargs)
+        user: ChannelUser = self.request.user  # noqa
+        # @see messenger.inbox.aget_inbox_page
+        page = await aget_inbox_page(user.pk, self.request.GET.get('cursor'))
+        context['text_messages'] = page.messages  # Sorted for time of creation
+        context['next_cursor'] = page.next_cursor
+        context['user_message_type'] = MessageType.USER_TEXT_MESSAGE
+        context['group_message_type'] = MessageType.GROUP_TEXT_MESSAGE
+        return context
+
+
+class AsyncUserMessageView(AsyncTemplateView):
+    """
+    Asynchronous variant of ``UserMessageView``
+    """
+    template_name = UserMessageView.template_name
+    renders_fragments = True
+
+    async def aget_context_data(self, identifier: Optional[int] = None, **kwargs) -> dict[str, Any]:
+        context = await super().aget_context_data(**kwargs)
+        user: ChannelUser = self.request.user  # noqa
+        message = await UserTextMessage.objects.aget(id=identifier)
+        if message.user_id == user.pk and not message.received:
+            # NOTE: Same as the bulk mark-as-read, so concurrent requests never count the same message twice
+            await amark_as_read(user, (message.pk, ), ())
+            message.received = True
         # Finally present message on view
         context['message'] = message
         return context
+
+
+class AsyncGroupMessageView(AsyncTemplateView):
+    """
+    Asynchronous variant of ``GroupMessageView``
+    """
+    template_name = GroupMessageView.template_name
+    renders_fragments = True
+
+    async def aget_context_data(self, identifier: Optional[int] = None, **kwargs) -> dict[str, Any]:
+        context = await super().aget_context_data(**kwargs)
+        user: ChannelUser = self.request.user  # noqa
+        message = await GroupTextMessage.objects.aget(id=identifier)
+        # Mark message as received (@see messenger.models.AbstractGroupMessage.received_group)
+        # NOTE: Same as the bulk mark-as-read, so concurrent first reads never count the same message twice
+        await amark_as_read(user, (), (message.pk, ))
+        # Finally present message on view
+        context['message'] = message
+        return context
+
+
+class MarkAsReadView(View):
+    """
+    Marks many (or all) messages of the current user as read at once.
+
+    Expects a JSON body like ``{"userMessages": [1, 2], "groupMessages": [3]}``. Instead of a list of primary keys,
+    ``"all"`` marks all messages of this type as read.
+
+    @see :func:`messenger.inbox.mark_as_read`
+    """
+
+    def post(self, request: HttpRequest, *args, **kwargs) -> HttpResponse:
+        user: ChannelUser = request.user  # noqa
+        if user.is_anonymous:
+            return HttpResponseForbidden()
+        try:
+            data: dict[str, Any] = json.loads(request.body)
+            user_message_pks = self._get_primary_keys(data, 'userMessages')
+            group_message_pks = self._get_primary_keys(data, 'groupMessages')
+        except (ValueError, TypeError, AttributeError):
+            return HttpResponseBadRequest('Invalid messages')
+        read_messages = mark_as_read(user, user_message_pks, group_message_pks)
+        return JsonResponse({'readMessages': read_messages})
+
+    @staticmethod
+    def _get_primary_keys(data: dict[str, Any], key: str) -> Optional[list[int]]:
+        value = data.get(key, [])
+        return None if value == 'all' else [int(identifier) for identifier in value]
+
+
+class MetricsView(View):
+    """
+    Scrape endpoint for the metrics of this worker process in the Prometheus text format.
+
+    @see :mod:`messenger.metrics`
+    """
+    content_type = 'text/plain; version=0.0.4; charset=utf-8'
+
+    def get(self, request: HttpRequest, *args, **kwargs) -> HttpResponse:
+        return HttpResponse(REGISTRY.render(), content_type=self.content_type)
+
+
+class ReadinessView(View):
+    """
+    Readiness probe for load balancers. Reports this worker process as ready only once it is warmed up.
+
+    @see :mod:`messenger.warmup`
+    """
+
+    async def get(self, request: HttpRequest, *args, **kwargs) -> HttpResponse:
+        if is_ready():
+            return HttpResponse('ready', content_type='text/plain')
+        # ASGI servers without lifespan support never warmed up this worker process, so do it now
+        ensure_warm_up()
+        return HttpResponse('warming up', content_type='text/plain', status=503)
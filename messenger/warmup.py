@@ -0,0 +1,106 @@
+"""
+Eager initialization of all connections a worker process needs to serve websocket clients quickly.
+
+Without warm-up, the first ``group_add`` of the first connecting client lazily opens the channel layer connection,
+so the first clients after every deploy see very slow connects.
+
+@see https://forum.djangoproject.com/t/django-channels-with-redis-slow-intialization/33470
+@see `ASGI DOCs - Lifespan Protocol <https://asgi.readthedocs.io/en/latest/specs/lifespan.html>`__
+"""
+__all__ = ('warm_up', 'ensure_warm_up', 'is_ready', 'LifespanApplication')
+
+import asyncio
+from logging import getLogger
+from time import perf_counter
+from typing import Any, Callable, Awaitable, Optional
+
+from asgiref.sync import sync_to_async
+from channels.layers import get_channel_layer
+from django.db import connections
+
+from messenger.connections import get_redis, close_redis
+from messenger.presence import RedisPresenceRegistry, get_presence_registry
+
+LOGGER = getLogger(__name__)
+
+_READY: bool = False
+_WARM_UP_TASK: Optional[asyncio.Task] = None
+
+
+async def _warm_up_channel_layer() -> None:
+    channel_layer = get_channel_layer()
+    # NOTE: Only the Redis channel layer has connections, the in-memory channel layer has nothing to warm up
+    if channel_layer is not None and hasattr(channel_layer, 'connection'):
+        for index in range(channel_layer.ring_size):
+            await channel_layer.connection(index).ping()
+
+
+async def _warm_up_presence() -> None:
+    if isinstance(get_presence_registry(), RedisPresenceRegistry):
+        await get_redis().ping()
+
+
+def _warm_up_databases() -> None:
+    for connection in connections.all():
+        connection.ensure_connection()
+
+
+async def warm_up() -> None:
+    """
+    Opens the channel layer connections, the presence connection pool and the database connections.
+    Afterward this worker process reports to be ready.
+
+    :raise Exception: If any of the connections can not be opened
+    """
+    global _READY
+    start = perf_counter()
+    await _warm_up_channel_layer()
+    await _warm_up_presence()
+    await sync_to_async(_warm_up_databases)()
+    _READY = True
+    LOGGER.info(f'Worker warmed up in {perf_counter() - start:.3f}s')
+
+
+def ensure_warm_up() -> asyncio.Task:
+    """
+    Starts the warm-up in the background (if it is not already running or succeeded)
+
+    :return: Warm-up task
+    """
+    global _WARM_UP_TASK
+    if _WARM_UP_TASK is None or (_WARM_UP_TASK.done() and not _READY):
+        _WARM_UP_TASK = asyncio.create_task(warm_up())
+    return _WARM_UP_TASK
+
+
+def is_ready() -> bool:
+    """
+    :return: If this worker process is warmed up and ready to serve clients
+    """
+    return _READY
+
+
+class LifespanApplication:
+    """
+    ASGI application for the lifespan protocol, that warms up the worker process on startup.
+    The ASGI server does not accept any connections before the startup is complete.
+
+    NOTE: Not every ASGI server supports the lifespan protocol (e.g. Daphne does not). In this case, the readiness
+          endpoint (@see ``messenger.views.ReadinessView``) triggers the warm-up instead.
+    """
+
+    async def __call__(self, scope: dict[str, Any], receive: Callable[[], Awaitable[dict[str, Any]]], send: Callable[[dict[str, Any]], Awaitable[None]]) -> None:
+        while True:
+            message = await receive()
+            if message['type'] == 'lifespan.startup':
+                try:
+                    await ensure_warm_up()
+                except Exception as exc:  # noqa - Any failure must be reported to the ASGI server
+                    LOGGER.exception('Warm-up failed')
+                    await send({'type': 'lifespan.startup.failed', 'message': str(exc)})
+                    return
+                await send({'type': 'lifespan.startup.complete'})
+            elif message['type'] == 'lifespan.shutdown':
+                await close_redis()
+                await send({'type': 'lifespan.shutdown.complete'})
+                return